@@ -0,0 +1,174 @@
+"""
+計測したスループットに基づいてバッチサイズを選ぶチューナ
+"""
+
+from __future__ import annotations
+
+import threading
+from dataclasses import dataclass
+from typing import Dict, List, Tuple
+
+# 生成条件 (幅, 高さ, ステップ数)
+Profile = Tuple[int, int, int]
+
+
+@dataclass(frozen=True)
+class TunerConsts:
+    """
+    このモジュール関連の定数
+    """
+
+    # 試行するバッチサイズの候補 (昇順)
+    candidates: Tuple[int, ...] = (1, 2, 4, 8)
+    # 候補ごとに計測するリクエスト数
+    samples_per_candidate: int = 2
+    # 候補ごとに保持する計測数 (古いものから捨て, 負荷の変化に追従する)
+    max_samples_per_candidate: int = 16
+    # 遅延の上限の既定値 (s)
+    latency_budget: float = 30.0
+
+
+class BatchTuning:
+    """
+    1 つの生成条件についてのバッチサイズごとの計測結果
+    """
+
+    def __init__(self):
+        """
+        コンストラクタ
+        """
+        # バッチサイズ: [(画像数, 所要時間 (s)), ...]
+        self.samples: Dict[int, List[Tuple[float, float]]] = {}
+
+    def num_samples(self, batch_size: int) -> int:
+        """
+        指定のバッチサイズの計測数
+
+        Args:
+            batch_size (int): バッチサイズ
+
+        Returns:
+            int: 計測数
+        """
+        return len(self.samples.get(batch_size, []))
+
+    def latency(self, batch_size: int) -> float:
+        """
+        指定のバッチサイズの 1 反復あたりの平均所要時間
+
+        Args:
+            batch_size (int): バッチサイズ
+
+        Returns:
+            float: 平均所要時間 (s)
+        """
+        samples = self.samples[batch_size]
+        return sum(elapsed for _, elapsed in samples) / len(samples)
+
+    def throughput(self, batch_size: int) -> float:
+        """
+        指定のバッチサイズのスループット
+
+        Args:
+            batch_size (int): バッチサイズ
+
+        Returns:
+            float: 1 秒あたりの画像数
+        """
+        samples = self.samples[batch_size]
+        elapsed = sum(elapsed for _, elapsed in samples)
+        return sum(images for images, _ in samples) / elapsed if elapsed > 0 else 0.0
+
+
+class BatchTuner:
+    """
+    バッチサイズの自動チューナ\n
+    生成条件ごとに候補のバッチサイズを小さい順に試行して画像数/秒とリクエストあたりの遅延を計測し,
+    遅延の上限を満たす中でスループットが最大のバッチサイズを選ぶ\n
+    生成条件が変わった場合は, その条件について改めて計測する
+    """
+
+    def __init__(self, candidates: Tuple[int, ...] = TunerConsts.candidates):
+        """
+        コンストラクタ
+
+        Args:
+            candidates (Tuple[int, ...], optional): バッチサイズの候補 (昇順),
+                Defaults to TunerConsts.candidates.
+        """
+        self.candidates = candidates
+        self.lock = threading.Lock()
+        self.tunings: Dict[Profile, BatchTuning] = {}
+
+    def choose(self, profile: Profile, latency_budget: float, n_iter: int = 1) -> int:
+        """
+        指定の生成条件で用いるバッチサイズを選ぶ\n
+        リクエストあたりの遅延は, 1 反復あたりの遅延に反復回数を乗じて見積もる\n
+        計測が足りない候補があれば, 遅延の上限を超えると見込まれない限りそれを試行する\n
+        (計測結果が届くまでに繰り返し選ばれた場合, その候補の計測数が増えるだけで害はない)
+
+        Args:
+            profile (Profile): 生成条件 (幅, 高さ, ステップ数)
+            latency_budget (float): リクエストあたりの遅延の上限 (s)
+            n_iter (int, optional): 見込まれるリクエストあたりの反復回数, Defaults to 1.
+
+        Returns:
+            int: バッチサイズ
+        """
+        with self.lock:
+            tuning = self.tunings.setdefault(profile, BatchTuning())
+            best = self.candidates[0]
+            best_throughput = 0.0
+            for batch_size in self.candidates:
+                if tuning.num_samples(batch_size) < TunerConsts.samples_per_candidate:
+                    # 計測不足: 計測済みの最良値から, 遅延が画像数に比例するとみなして見積もる
+                    if (
+                        best_throughput > 0
+                        and batch_size * n_iter / best_throughput > latency_budget
+                    ):
+                        break
+                    return batch_size
+                if tuning.latency(batch_size) * n_iter > latency_budget:
+                    break
+                throughput = tuning.throughput(batch_size)
+                if throughput > best_throughput:
+                    best, best_throughput = batch_size, throughput
+            return best
+
+    def record(
+        self, profile: Profile, batch_size: int, num_images: int, elapsed: float, n_iter: int = 1
+    ) -> None:
+        """
+        リクエストの計測結果を記録する\n
+        反復回数 (n_iter) が 2 以上の場合は, 1 反復あたりの値に換算する
+
+        Args:
+            profile (Profile): 生成条件 (幅, 高さ, ステップ数)
+            batch_size (int): バッチサイズ
+            num_images (int): 生成された画像数
+            elapsed (float): リクエストの所要時間 (s)
+            n_iter (int, optional): 反復回数, Defaults to 1.
+        """
+        if num_images <= 0 or elapsed <= 0:
+            return
+        with self.lock:
+            tuning = self.tunings.setdefault(profile, BatchTuning())
+            samples = tuning.samples.setdefault(batch_size, [])
+            samples.append((num_images / n_iter, elapsed / n_iter))
+            del samples[: -TunerConsts.max_samples_per_candidate]
+
+    def lines(self) -> List[str]:
+        """
+        生成条件ごとの計測結果を文字列で取得する
+
+        Returns:
+            List[str]: 生成条件, バッチサイズごとの計測結果
+        """
+        with self.lock:
+            return [
+                f"{width}x{height}@{steps} batch={batch_size}: "
+                f"{tuning.throughput(batch_size):.2f} img/s, "
+                f"latency={tuning.latency(batch_size):.1f} s/iter, samples={len(samples)}"
+                for (width, height, steps), tuning in self.tunings.items()
+                for batch_size, samples in sorted(tuning.samples.items())
+            ]
@@ -8,6 +8,7 @@ import json
 import random
 import socket
 import time
+from contextlib import asynccontextmanager
 from typing import Dict, List, Optional
 
 import uvicorn
@@ -15,8 +16,20 @@ from fastapi import FastAPI
 from PIL import Image, ImageDraw, ImageFont
 from pydantic import BaseModel, Field
 
-app = FastAPI(title="Mock A1111 sdapi/v1/txt2img")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # A1111 と同様に生成は 1 件ずつ処理し, interrupt で処理中の生成を打ち切る
+    # (py3.8, 3.9 では生成時のイベントループに束縛されるため, サーバのループ上で生成する)
+    app.state.job_lock = asyncio.Lock()
+    app.state.interrupted = asyncio.Event()
+    yield
+
+
+app = FastAPI(title="Mock A1111 sdapi/v1/txt2img", lifespan=lifespan)
 app.state.cooldown = 0
+# 処理中の生成 (progress で cooldown の経過を進捗として返す)
+app.state.job = None
 
 
 class Txt2ImgRequest(BaseModel):
@@ -64,6 +77,23 @@ class Txt2ImgRequest(BaseModel):
     alwayson_scripts: Optional[Dict] = None
 
 
+class ExtrasSingleImageRequest(BaseModel):
+    image: str = ""
+    resize_mode: Optional[int] = 0
+    show_extras_results: Optional[bool] = True
+    gfpgan_visibility: Optional[float] = 0.0
+    codeformer_visibility: Optional[float] = 0.0
+    codeformer_weight: Optional[float] = 0.0
+    upscaling_resize: Optional[float] = Field(default=2.0, gt=0)
+    upscaling_resize_w: Optional[int] = 512
+    upscaling_resize_h: Optional[int] = 512
+    upscaling_crop: Optional[bool] = True
+    upscaler_1: Optional[str] = "None"
+    upscaler_2: Optional[str] = "None"
+    extras_upscaler_2_visibility: Optional[float] = 0.0
+    upscale_first: Optional[bool] = False
+
+
 def dump_infos(obj) -> str:
     return json.dumps(obj, ensure_ascii=False)
 
@@ -83,12 +113,103 @@ def make_infotext(
     return line
 
 
+@app.get("/internal/ping")
+async def ping():
+    return {}
+
+
+@app.post("/sdapi/v1/interrupt")
+async def interrupt():
+    if app.state.job_lock.locked():
+        app.state.interrupted.set()
+    return {}
+
+
+@app.get("/sdapi/v1/progress")
+async def progress(skip_current_image: bool = False):
+    job = app.state.job
+    if job is None:
+        return {
+            "progress": 0.0,
+            "eta_relative": 0.0,
+            "state": {"job_count": 0, "job_no": 0, "sampling_step": 0, "sampling_steps": 0},
+            "current_image": None,
+            "textinfo": None,
+        }
+
+    elapsed = time.monotonic() - job["started"]
+    ratio = min(elapsed / job["duration"], 1.0) if job["duration"] > 0 else 1.0
+    # n_iter 回のジョブそれぞれで steps 回サンプリングするものとして進捗を按分する
+    job_pos = ratio * job["n_iter"]
+    job_no = min(int(job_pos), job["n_iter"] - 1)
+    return {
+        "progress": ratio,
+        "eta_relative": max(job["duration"] - elapsed, 0.0),
+        "state": {
+            "skipped": False,
+            "interrupted": app.state.interrupted.is_set(),
+            "job": f"Batch {job_no + 1} out of {job['n_iter']}",
+            "job_count": job["n_iter"],
+            "job_timestamp": job["timestamp"],
+            "job_no": job_no,
+            "sampling_step": min(int((job_pos - job_no) * job["steps"]), job["steps"]),
+            "sampling_steps": job["steps"],
+        },
+        "current_image": None,
+        "textinfo": None,
+    }
+
+
 @app.post("/sdapi/v1/txt2img")
 async def txt2img(req: Txt2ImgRequest):
-    cooldown = getattr(app.state, "cooldown", 0)
-    if cooldown > 0:
-        await asyncio.sleep(cooldown)
+    async with app.state.job_lock:
+        app.state.interrupted.clear()
+        cooldown = getattr(app.state, "cooldown", 0)
+        app.state.job = {
+            "started": time.monotonic(),
+            "duration": cooldown,
+            "steps": req.steps or 0,
+            "n_iter": max(1, req.n_iter or 1),
+            "timestamp": datetime.datetime.now().strftime("%Y%m%d%H%M%S"),
+        }
+        try:
+            if cooldown > 0:
+                try:
+                    await asyncio.wait_for(app.state.interrupted.wait(), cooldown)
+                    print("Interrupted.")
+                except asyncio.TimeoutError:
+                    pass
+            return make_txt2img_response(req)
+        finally:
+            app.state.job = None
+
+
+@app.post("/sdapi/v1/extra-single-image")
+async def extra_single_image(req: ExtrasSingleImageRequest):
+    async with app.state.job_lock:
+        return make_extra_single_image_response(req)
+
+
+def make_extra_single_image_response(req: ExtrasSingleImageRequest) -> Dict:
+    # A1111 と同様に出力画像にはメタデータを付与しない
+    MAX_SIDE = 8192
+    img = Image.open(io.BytesIO(base64.b64decode(req.image.split(",", 1)[-1])))
+    if req.resize_mode == 1:
+        size = (req.upscaling_resize_w, req.upscaling_resize_h)
+    else:
+        size = (round(img.width * req.upscaling_resize), round(img.height * req.upscaling_resize))
+    size = tuple(max(1, min(side, MAX_SIDE)) for side in size)
+    img = img.convert("RGB").resize(size, Image.Resampling.LANCZOS)
+
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    return {
+        "image": base64.b64encode(buf.getvalue()).decode("ascii"),
+        "html_info": f"<p>Postprocess upscaler: {req.upscaler_1}, size: {size[0]}x{size[1]}</p>",
+    }
+
 
+def make_txt2img_response(req: Txt2ImgRequest) -> Dict:
     MAX_SIDE = 8192
     width = max(1, min(req.width, MAX_SIDE))
     height = max(1, min(req.height, MAX_SIDE))
@@ -6,11 +6,13 @@ from __future__ import annotations
 
 import tkinter
 from tkinter import Frame, TclError, ttk
-from typing import Callable
+from typing import Callable, List, Tuple
 
 from PIL import Image, ImageTk
 
+from batchtuner import TunerConsts
 from picmanager import PicManager, PicStats
+from picretention import RetentionPolicy
 
 
 class Displayer:
@@ -89,6 +91,22 @@ class Displayer:
                     self.batch_size_entry = owner.super_owner.super_owner.put_textbox(
                         self.sd_interior_config_frame, "生成数", 2, 2, 4, str(2)
                     )
+                    # チェックボックス(生成数の自動調整)
+                    self.auto_batch_size_check = tkinter.BooleanVar()
+                    ttk.Checkbutton(
+                        self.sd_interior_config_frame,
+                        text="自動",
+                        variable=self.auto_batch_size_check,
+                    ).grid(row=2, column=4, padx=6, pady=6, sticky="w")
+                    # テキストボックス(自動調整時のリクエストあたりの遅延上限)
+                    self.latency_budget_entry = owner.super_owner.super_owner.put_textbox(
+                        self.sd_interior_config_frame,
+                        "遅延上限(s)",
+                        3,
+                        0,
+                        4,
+                        str(TunerConsts.latency_budget),
+                    )
 
             class SDExteriorConfigFrame:
                 """
@@ -115,6 +133,43 @@ class Displayer:
                     self.port_entry = owner.super_owner.super_owner.put_textbox(
                         self.sd_exterior_config_frame, "ポート", 0, 2, 6, str(7860)
                     )
+                    # テキストボックス(追加サーバ, "IPアドレス:ポート" のカンマ区切り)
+                    self.extra_srvs_entry = owner.super_owner.super_owner.put_textbox(
+                        self.sd_exterior_config_frame, "追加サーバ", 1, 0, 32, ""
+                    )
+                    self.extra_srvs_entry.grid(columnspan=3)
+                    # チェックボックス(注目キャラクタ変更時に生成中のタスクを中断)
+                    self.interrupt_stale_check = tkinter.BooleanVar()
+                    ttk.Checkbutton(
+                        self.sd_exterior_config_frame,
+                        text="キャラクタ変更時に生成を中断",
+                        variable=self.interrupt_stale_check,
+                    ).grid(row=2, column=0, columnspan=4, padx=6, pady=6, sticky="w")
+                    # チェックボックス(GPU の空き時間に全キャラクタの画像を先行生成)
+                    self.pregen_check = tkinter.BooleanVar()
+                    ttk.Checkbutton(
+                        self.sd_exterior_config_frame,
+                        text="空き時間に先行生成",
+                        variable=self.pregen_check,
+                    ).grid(row=3, column=0, columnspan=4, padx=6, pady=6, sticky="w")
+                    # テキストボックス(キャラクタあたりの最大画像数, 0 で無制限)
+                    self.max_pics_per_dir_entry = owner.super_owner.super_owner.put_textbox(
+                        self.sd_exterior_config_frame,
+                        "最大枚数",
+                        4,
+                        0,
+                        6,
+                        str(RetentionPolicy.max_pics_per_dir),
+                    )
+                    # テキストボックス(画像ディレクトリ全体の最大容量 (MiB), 0 で無制限)
+                    self.max_total_mib_entry = owner.super_owner.super_owner.put_textbox(
+                        self.sd_exterior_config_frame,
+                        "最大容量(MiB)",
+                        4,
+                        2,
+                        6,
+                        str(RetentionPolicy.max_total_bytes // 1024**2),
+                    )
 
             class RunningModeFrame:
                 """
@@ -140,6 +195,67 @@ class Displayer:
                         text=f"動作モード: {owner.super_owner.super_owner.ownername}",
                     ).grid(row=0, column=0, padx=6, pady=6, sticky="e")
 
+            class DeadLetterFrame:
+                """
+                失敗タスク表示フレーム
+                """
+
+                def __init__(self, owner: Displayer.ConfigWindow.MainTab):
+                    """
+                    失敗タスク表示フレームコンストラクタ
+
+                    Args:
+                        owner (Displayer.ConfigWindow.MainTab): MainTab インスタンス
+                    """
+                    self.owner = owner
+
+                    self.dead_letter_frame = ttk.Frame(owner.main_frame)
+                    self.dead_letter_frame.grid(row=4, column=0, sticky="ew")
+                    self.dead_letter_frame.columnconfigure(0, weight=1)
+
+                    # 失敗タスク一覧
+                    ttk.Label(self.dead_letter_frame, text="失敗タスク").grid(
+                        row=0, column=0, padx=6, pady=(6, 0), sticky="w"
+                    )
+                    self.dead_letter_listbox = tkinter.Listbox(
+                        self.dead_letter_frame, height=4, width=60
+                    )
+                    self.dead_letter_listbox.grid(row=1, column=0, padx=6, pady=6, sticky="ew")
+                    # ボタン(失敗タスクの再投入)
+                    self.retry_button = ttk.Button(
+                        self.dead_letter_frame,
+                        text="再投入",
+                        command=owner.super_owner.super_owner.on_retry_dead_letters,
+                    )
+                    self.retry_button.grid(row=1, column=1, padx=6, pady=6, sticky="n")
+
+            class ProgressFrame:
+                """
+                生成進捗表示フレーム
+                """
+
+                def __init__(self, owner: Displayer.ConfigWindow.MainTab):
+                    """
+                    生成進捗表示フレームコンストラクタ
+
+                    Args:
+                        owner (Displayer.ConfigWindow.MainTab): MainTab インスタンス
+                    """
+                    self.owner = owner
+
+                    self.progress_frame = ttk.Frame(owner.main_frame)
+                    self.progress_frame.grid(row=5, column=0, sticky="ew")
+                    self.progress_frame.columnconfigure(0, weight=1)
+
+                    # 進捗バー
+                    self.progress_bar = ttk.Progressbar(
+                        self.progress_frame, maximum=100, mode="determinate"
+                    )
+                    self.progress_bar.grid(row=0, column=0, padx=6, pady=6, sticky="ew")
+                    # 残り時間
+                    self.eta_label = ttk.Label(self.progress_frame, text="待機中", width=20)
+                    self.eta_label.grid(row=0, column=1, padx=6, pady=6, sticky="w")
+
             def __init__(self, owner: Displayer.ConfigWindow):
                 """
                 メインタブコンストラクタ
@@ -156,6 +272,8 @@ class Displayer:
                 self.sd_interior_config_frame = self.SDInteriorConfigFrame(self)
                 self.sd_exterior_config_frame = self.SDExteriorConfigFrame(self)
                 self.running_mode_frame = self.RunningModeFrame(self)
+                self.dead_letter_frame = self.DeadLetterFrame(self)
+                self.progress_frame = self.ProgressFrame(self)
 
         class DebugTab:
             """
@@ -192,6 +310,20 @@ class Displayer:
                         command=owner.super_owner.super_owner.on_dump_picmanager,
                     )
                     self.debug_button.grid(row=1, column=0, padx=6, pady=6, sticky="w")
+                    # ボタン(統計出力)
+                    self.stats_button = ttk.Button(
+                        self.exe_debug_frame,
+                        text="統計",
+                        command=owner.super_owner.super_owner.on_print_stats,
+                    )
+                    self.stats_button.grid(row=2, column=0, padx=6, pady=6, sticky="w")
+                    # チェックボックス(JSON Lines 形式でダンプ)
+                    self.dump_jsonl_check = tkinter.BooleanVar()
+                    ttk.Checkbutton(
+                        self.exe_debug_frame,
+                        text="JSON Lines",
+                        variable=self.dump_jsonl_check,
+                    ).grid(row=1, column=1, padx=6, pady=6, sticky="w")
                     # チェックボックス
                     self.allow_edit_clipboard_check = tkinter.BooleanVar()
                     ttk.Checkbutton(
@@ -378,6 +510,8 @@ class Displayer:
         on_append: Callable[[], None],
         on_debug: Callable[[], None],
         on_dump_picmanager: Callable[[], None],
+        on_print_stats: Callable[[], None],
+        on_retry_dead_letters: Callable[[], None],
         on_good: Callable[[], None],
         on_bad: Callable[[], None],
         ownername: str,
@@ -391,6 +525,8 @@ class Displayer:
             on_append (Callable[[], None]): タスク登録処理コールバック
             on_debug (Callable[[], None]): デバッグ処理コールバック
             on_dump_picmanager (Callable[[], None]): PicManager ダンプコールバック
+            on_print_stats (Callable[[], None]): 統計出力コールバック
+            on_retry_dead_letters (Callable[[], None]): 失敗タスク再投入コールバック
             on_good (Callable[[], None]): Good 処理コールバック
             on_bad (Callable[[], None]): Bad 処理コールバック
             ownername (str): 所有者の名前
@@ -402,6 +538,8 @@ class Displayer:
         self.on_append: Callable[[], None] = on_append
         self.on_debug: Callable[[], None] = on_debug
         self.on_dump_picmanager: Callable[[], None] = on_dump_picmanager
+        self.on_print_stats: Callable[[], None] = on_print_stats
+        self.on_retry_dead_letters: Callable[[], None] = on_retry_dead_letters
         self.on_good: Callable[[], None] = on_good
         self.on_bad: Callable[[], None] = on_bad
 
@@ -528,6 +666,36 @@ class Displayer:
         self.picmanager.crnt_picstats = picstats
         self.switch_output_button_state(True)
 
+    def update_dead_letters(self, lines: List[str]) -> None:
+        """
+        失敗タスク一覧の表示を更新する
+
+        Args:
+            lines (List[str]): 失敗タスクごとの表示文字列
+        """
+        if not self.is_config_window_open():
+            return
+
+        listbox = self.config_window.main_tab.dead_letter_frame.dead_letter_listbox
+        listbox.delete(0, tkinter.END)
+        for line in lines:
+            listbox.insert(tkinter.END, line)
+
+    def update_progress(self, progress: float, text: str) -> None:
+        """
+        生成進捗の表示を更新する
+
+        Args:
+            progress (float): 進捗率 (0.0 - 1.0)
+            text (str): 進捗バー横の表示文字列 (残り時間など)
+        """
+        if not self.is_config_window_open():
+            return
+
+        progress_frame = self.config_window.main_tab.progress_frame
+        progress_frame.progress_bar.configure(value=progress * 100)
+        progress_frame.eta_label.configure(text=text)
+
     def switch_output_button_state(self, toggle: bool) -> None:
         """
         表示ボタンの有効/無効(グレーアウト)を切り替える
@@ -576,6 +744,69 @@ class Displayer:
         """
         return self.config_window.main_tab.sd_exterior_config_frame.port_entry.get()
 
+    @property
+    def srv_endpoints(self) -> List[Tuple[str, str]]:
+        """
+        ポスト先サーバ群\n
+        IP アドレス, ポートで指定したサーバを先頭に, 追加サーバを重複なく並べる\n
+        追加サーバのうち "IPアドレス:ポート" 形式でないものは無視する
+
+        Returns:
+            List[Tuple[str, str]]: (IP アドレス, ポート) 群
+        """
+        endpoints = [(self.srv_ipaddr, self.srv_port)]
+        extra_srvs = self.config_window.main_tab.sd_exterior_config_frame.extra_srvs_entry.get()
+        for extra_srv in extra_srvs.split(","):
+            ipaddr, sep, port = extra_srv.strip().rpartition(":")
+            if sep and ipaddr and port and (ipaddr, port) not in endpoints:
+                endpoints.append((ipaddr, port))
+        return endpoints
+
+    @property
+    def interrupt_stale(self) -> bool:
+        """
+        注目キャラクタの変更時に, 不要になった生成中のタスクを中断するか
+
+        Returns:
+            bool: True: 中断する, False: 中断しない
+        """
+        return self.config_window.main_tab.sd_exterior_config_frame.interrupt_stale_check.get()
+
+    @property
+    def pregen(self) -> bool:
+        """
+        GPU の空き時間にキャラクタテーブルの画像を先行生成するか
+
+        Returns:
+            bool: True: 先行生成する, False: 先行生成しない
+        """
+        return self.config_window.main_tab.sd_exterior_config_frame.pregen_check.get()
+
+    @property
+    def max_pics_per_dir(self) -> int:
+        """
+        プロンプトディレクトリ (キャラクタ) あたりの最大画像数
+
+        Returns:
+            int: 最大画像数, 0 で無制限
+        """
+        return int(
+            self.config_window.main_tab.sd_exterior_config_frame.max_pics_per_dir_entry.get()
+        )
+
+    @property
+    def max_total_bytes(self) -> int:
+        """
+        画像ディレクトリ全体の最大容量
+
+        Returns:
+            int: 最大容量 (byte), 0 で無制限
+        """
+        return (
+            int(self.config_window.main_tab.sd_exterior_config_frame.max_total_mib_entry.get())
+            * 1024**2
+        )
+
     @property
     def sd_steps(self) -> int:
         """
@@ -616,6 +847,28 @@ class Displayer:
         """
         return int(self.config_window.main_tab.sd_interior_config_frame.height_entry.get())
 
+    @property
+    def auto_batch_size(self) -> bool:
+        """
+        生成数 (バッチサイズ) を計測したスループットに基づいて自動調整するか
+
+        Returns:
+            bool: True: 自動調整する, False: 入力値を用いる
+        """
+        return self.config_window.main_tab.sd_interior_config_frame.auto_batch_size_check.get()
+
+    @property
+    def latency_budget(self) -> float:
+        """
+        生成数の自動調整時のリクエストあたりの遅延上限
+
+        Returns:
+            float: 遅延上限 (s)
+        """
+        return float(
+            self.config_window.main_tab.sd_interior_config_frame.latency_budget_entry.get()
+        )
+
     @property
     def allow_edit_clipboard(self) -> bool:
         """
@@ -626,6 +879,16 @@ class Displayer:
         """
         return self.config_window.debug_tab.exe_debug_frame.allow_edit_clipboard_check.get()
 
+    @property
+    def dump_jsonl(self) -> bool:
+        """
+        PicManager ダンプを JSON Lines 形式で行うか
+
+        Returns:
+            bool: True: JSON Lines 形式, False: json 形式
+        """
+        return self.config_window.debug_tab.exe_debug_frame.dump_jsonl_check.get()
+
     @property
     def print_new_clipboard(self) -> bool:
         """
@@ -0,0 +1,207 @@
+"""
+画像メタデータの永続インデックス
+"""
+
+from __future__ import annotations
+
+import json
+import sqlite3
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+
+@dataclass(frozen=True)
+class PicIndexConsts:
+    """
+    このクラス関連の定数
+    """
+
+    # インデックスファイル名 (監視対象ディレクトリ直下に配置する)
+    filename: str = "picindex.sqlite3"
+    # スキーマバージョン
+    schema_version: int = 2
+
+
+@dataclass
+class PicIndexRow:
+    """
+    インデックスの 1 レコード
+    """
+
+    # 画像のパス
+    path: str
+    # 最終更新時刻 (ns)
+    mtime_ns: int
+    # ファイルサイズ (byte)
+    size: int
+    # PicInfo.to_dict() の内容
+    info: Dict[str, Any]
+    # 評価スコア (GOOD で加算, BAD で減算)
+    score: int = 0
+
+    def is_fresh(self, mtime_ns: int, size: int) -> bool:
+        """
+        指定のファイル属性と一致するか, つまりインデックスの内容が最新であるか
+
+        Args:
+            mtime_ns (int): 最終更新時刻 (ns)
+            size (int): ファイルサイズ (byte)
+
+        Returns:
+            bool: True: 最新, False: 古い
+        """
+        return self.mtime_ns == mtime_ns and self.size == size
+
+
+class PicIndex:
+    """
+    画像メタデータの永続インデックス\n
+    パス, 最終更新時刻, ファイルサイズをキーに PicInfo の内容を SQLite に保持する\n
+    生成スレッドと GUI スレッドの双方から使用されるため, 操作はロックで直列化する
+    """
+
+    def __init__(self, rootdir: Path):
+        """
+        コンストラクタ\n
+        インデックスファイルが存在しない場合は作成する
+
+        Args:
+            rootdir (Path): 監視対象ディレクトリ
+        """
+        rootdir.mkdir(parents=True, exist_ok=True)
+        self.path = rootdir / PicIndexConsts.filename
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.create_tables()
+
+    def create_tables(self) -> None:
+        """
+        テーブルを作成する\n
+        旧スキーマ (バージョン 1) の場合はスコア列を追加する\n
+        それ以外でスキーマバージョンが異なる場合は作り直す (スコア以外は画像から再取得できる)
+        """
+        with self.lock, self.conn:
+            version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+            if version == 1:
+                self.conn.execute("ALTER TABLE pics ADD COLUMN score INTEGER NOT NULL DEFAULT 0")
+            elif version != PicIndexConsts.schema_version:
+                self.conn.execute("DROP TABLE IF EXISTS pics")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS pics ("
+                "path TEXT PRIMARY KEY, mtime_ns INTEGER NOT NULL, "
+                "size INTEGER NOT NULL, info TEXT NOT NULL, score INTEGER NOT NULL DEFAULT 0)"
+            )
+            self.conn.execute(f"PRAGMA user_version={PicIndexConsts.schema_version}")
+
+    def close(self) -> None:
+        """
+        インデックスを閉じる
+        """
+        with self.lock:
+            self.conn.close()
+
+    def load_all(self) -> Dict[str, PicIndexRow]:
+        """
+        全レコードをパスをキーとする Dict として取得する
+
+        Returns:
+            Dict[str, PicIndexRow]: レコード群
+        """
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT path, mtime_ns, size, info, score FROM pics"
+            ).fetchall()
+        return {
+            path: PicIndexRow(path, mtime_ns, size, json.loads(info), score)
+            for path, mtime_ns, size, info, score in rows
+        }
+
+    def load_scores(self) -> Dict[str, int]:
+        """
+        スコアが 0 でない全レコードのスコアを取得する
+
+        Returns:
+            Dict[str, int]: パスをキーとするスコア
+        """
+        with self.lock:
+            rows = self.conn.execute("SELECT path, score FROM pics WHERE score != 0").fetchall()
+        return dict(rows)
+
+    def paths(self) -> List[str]:
+        """
+        全レコードのパスを取得する
+
+        Returns:
+            List[str]: パス群
+        """
+        with self.lock:
+            rows = self.conn.execute("SELECT path FROM pics").fetchall()
+        return [row[0] for row in rows]
+
+    def get(self, path: Path) -> Optional[PicIndexRow]:
+        """
+        指定のパスのレコードを取得する
+
+        Args:
+            path (Path): 画像のパス
+
+        Returns:
+            Optional[PicIndexRow]: レコード, 存在しない場合は None
+        """
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT path, mtime_ns, size, info, score FROM pics WHERE path = ?", (str(path),)
+            ).fetchone()
+        if row is None:
+            return None
+        return PicIndexRow(row[0], row[1], row[2], json.loads(row[3]), row[4])
+
+    def upsert(self, rows: Iterable[PicIndexRow]) -> None:
+        """
+        レコード群を登録する, すでに存在する場合は上書きする\n
+        ただしスコアは画像の内容に依らないため, 既存レコードのものを維持する
+
+        Args:
+            rows (Iterable[PicIndexRow]): レコード群
+        """
+        params = [
+            (row.path, row.mtime_ns, row.size, json.dumps(row.info, ensure_ascii=False))
+            for row in rows
+        ]
+        if not params:
+            return
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "INSERT INTO pics (path, mtime_ns, size, info) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(path) DO UPDATE SET "
+                "mtime_ns = excluded.mtime_ns, size = excluded.size, info = excluded.info",
+                params,
+            )
+
+    def set_score(self, path: Path, score: int) -> None:
+        """
+        指定のパスのレコードのスコアを更新する
+
+        Args:
+            path (Path): 画像のパス
+            score (int): スコア
+        """
+        with self.lock, self.conn:
+            self.conn.execute("UPDATE pics SET score = ? WHERE path = ?", (score, str(path)))
+
+    def delete(self, paths: Iterable[str]) -> None:
+        """
+        指定のパス群のレコードを削除する
+
+        Args:
+            paths (Iterable[str]): 画像のパス群
+        """
+        params: List[tuple] = [(path,) for path in paths]
+        if not params:
+            return
+        with self.lock, self.conn:
+            self.conn.executemany("DELETE FROM pics WHERE path = ?", params)
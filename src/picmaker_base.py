@@ -6,24 +6,29 @@ from __future__ import annotations
 
 import base64
 import hashlib
-import io
 import json
 import random
+import sys
 import threading
-import time
 from abc import ABC, abstractmethod
-from collections import deque
 from dataclasses import dataclass
 from datetime import datetime
 from pathlib import Path
-from typing import Any, Dict, List, Mapping, Optional, Tuple
+from typing import Any, Callable, Dict, List, Mapping, Optional, Tuple
 
 import pyperclip
-import requests
-from PIL import Image
 
+from batchtuner import BatchTuner
 from displayer import Displayer
-from picmanager import PicManager, PicStats, SDPngInfo
+from picmanager import PicManager, PicStats, SDPngInfo, embed_pnginfo
+from picretention import PicRetention, RetentionPolicy
+from picwatcher import make_picwatcher
+from picwriter import PicWriter, StageTimings
+from pregen import PreGenScheduler
+from progress import ProgressPoller
+from sdclient import NoBackendAvailableError, SDBackendPool
+from taskqueue import TaskQueue
+from upscaler import Upscaler
 
 
 @dataclass(frozen=True)
@@ -35,6 +40,28 @@ class PMConsts:
 
     # デバッグ用キャラクター名の部分文字列
     charaname_substr_debug: str = "DebuggingPM"
+    # 画像のメタデータを初回参照時まで取得しないか
+    lazy_picinfo: bool = True
+    # 画像ディレクトリ全走査時の並列数
+    scan_workers: int = 4
+    # タスクを実行するワーカスレッド数 (全サーバへの同時送信数の合計以上が望ましい)
+    task_workers: int = 3
+    # サーバあたりの生成リクエストの同時送信数
+    max_inflight_per_server: int = 2
+    # 重複したタスクの統合で引き上げる反復回数 (n_iter) の上限
+    max_task_n_iter: int = 4
+    # 表示中のキャラクタ以外のタスクの有効期間 (s, 0 で無期限)
+    task_ttl: float = 300.0
+    # タスクあたりの最大試行回数 (超過したタスクは失敗タスク一覧へ移す)
+    task_max_attempts: int = 3
+    # タスクの再試行までの待機時間の初期値 (s), 再試行のたびに倍にする
+    task_retry_backoff: float = 2.0
+    # タスクの再試行までの待機時間の上限 (s)
+    task_retry_max_backoff: float = 30.0
+    # 失敗タスク一覧に保持する最大数
+    max_dead_letters: int = 50
+    # ワーカスレッドの死活監視の周期 (s)
+    supervise_interval: float = 1.0
 
 
 @dataclass
@@ -49,6 +76,49 @@ class PMFlags:
     is_task_thread_alive: bool = True
 
 
+@dataclass(frozen=True)
+class DeadLetter:
+    """
+    最大試行回数を超えて失敗したタスク
+    """
+
+    # タスク
+    task: PicMakerBase.TaskBlueprint
+    # 最後に発生した例外
+    error: str
+    # 失敗日時
+    failed_at: datetime
+
+    def __str__(self) -> str:
+        return f"{self.failed_at:%H:%M:%S} {self.task.pos_prompt[:32]}: {self.error}"
+
+
+@dataclass(frozen=True)
+class GenSettings:
+    """
+    タスクの予約時に確定する生成設定
+    """
+
+    # ステップ数
+    steps: int = 30
+    # 幅
+    width: int = 540
+    # 高さ
+    height: int = 960
+    # バッチサイズ
+    batch_size: int = 2
+
+    @property
+    def profile(self) -> Tuple[int, int, int]:
+        """
+        バッチサイズを除いた生成条件 (生成される画像の内容を左右する設定)
+
+        Returns:
+            Tuple[int, int, int]: (幅, 高さ, ステップ数)
+        """
+        return (self.width, self.height, self.steps)
+
+
 def dump_json(data: Dict, label: str) -> None:
     """
     指定の Dict を json 形式でダンプする
@@ -69,17 +139,23 @@ class PicMakerBase(ABC):
     class TaskBlueprint:
         """
         タスクの設計図\n
-        プロンプトの組, 生成キュー用に使用する\n
-        インスタンス化した際, その時点のプロンプトを記録中ステータスから生成し, セットする
+        プロンプトの組と生成設定, 生成キュー用に使用する\n
+        インスタンス化した際, その時点のプロンプトを記録中ステータスから生成し, セットする\n
+        プロンプトの組とバッチサイズを除く生成設定が等しいタスクは等価とみなす
+        (反復回数, バッチサイズは問わない, バッチサイズの自動調整中も統合できるように)
         """
 
         def __init__(
-            self, picmaker_base: PicMakerBase = None, pos_prompt: str = "", neg_prompt: str = ""
+            self,
+            picmaker_base: PicMakerBase = None,
+            pos_prompt: str = "",
+            neg_prompt: str = "",
+            settings: GenSettings | None = None,
         ):
             """
             コンストラクタ\n
-            PicManagerBase が指定されている場合は, 必ず記録中ステータスをもとに生成する\n
-            ただしプロンプト生成に十分なステータスでない場合は何もしない\n
+            PicManagerBase が指定されている場合は, 必ず記録中ステータスと生成設定をもとに生成する\n
+            ただしプロンプト生成に十分なステータスでない場合はプロンプトを空文字列とする\n
             PicManagerBase が指定されておらず, 両プロンプトが指定されている場合は直接初期化する\n
             それ以外は空文字列で初期化する
 
@@ -87,8 +163,21 @@ class PicMakerBase(ABC):
                 picmaker_base (PicMakerBase, optional): PicMakerBase インスタンス, Defaults to None.
                 pos_prompt (str, optional): ポジティブプロンプト, Defaults to "".
                 neg_prompt (str, optional): ネガティブプロンプト, Defaults to "".
+                settings (GenSettings | None, optional): 生成設定, None の場合は既定値,
+                    Defaults to None.
             """
+            self.pos_prompt = ""
+            self.neg_prompt = ""
+            self.settings = settings or GenSettings()
+            self.n_iter = 1
+            # 注目キャラクタの変更により不要になったか (結果は破棄される)
+            self.is_cancelled = False
+            # 取り消し後にサーバへ中断を要求したか (以後は取り消しを撤回できない)
+            self.is_interrupted = False
+            # 空き時間の先行生成によるタスクか
+            self.is_background = False
             if picmaker_base is not None:
+                self.settings = picmaker_base.get_gen_settings()
                 if not picmaker_base.is_stats_enough_for_prompt():
                     return
 
@@ -97,9 +186,45 @@ class PicMakerBase(ABC):
             elif (pos_prompt is not None) and (neg_prompt is not None):
                 self.pos_prompt = pos_prompt
                 self.neg_prompt = neg_prompt
-            else:
-                self.pos_prompt = ""
-                self.neg_prompt = ""
+
+        @property
+        def key(self) -> Tuple[str, str, Tuple[int, int, int]]:
+            """
+            タスクの内容を表すキー (バッチサイズは含まない)
+
+            Returns:
+                Tuple[str, str, Tuple[int, int, int]]:
+                    (ポジティブプロンプト, ネガティブプロンプト, (幅, 高さ, ステップ数))
+            """
+            return (self.pos_prompt, self.neg_prompt, self.settings.profile)
+
+        @property
+        def prompts(self) -> Tuple[str, str]:
+            """
+            プロンプトの組 (スケジューリングの優先度を決めるグループ)
+
+            Returns:
+                Tuple[str, str]: (ポジティブプロンプト, ネガティブプロンプト)
+            """
+            return (self.pos_prompt, self.neg_prompt)
+
+        def __eq__(self, other: object) -> bool:
+            if not isinstance(other, PicMakerBase.TaskBlueprint):
+                return NotImplemented
+            return self.key == other.key
+
+        def __hash__(self) -> int:
+            return hash(self.key)
+
+        def coalesce(self, other: PicMakerBase.TaskBlueprint) -> None:
+            """
+            等価なタスクを統合し, 反復回数を引き上げる (上限あり)\n
+            バッチサイズは統合先のものを用いる
+
+            Args:
+                other (PicMakerBase.TaskBlueprint): 統合するタスク
+            """
+            self.n_iter = min(self.n_iter + other.n_iter, PMConsts.max_task_n_iter)
 
     @property
     @abstractmethod
@@ -122,7 +247,12 @@ class PicMakerBase(ABC):
         self.crnt_clipboard = ""
         self.crnt_stats = {}
 
-        self.picmanager = PicManager(self.pics_dir_path())
+        self.picmanager = PicManager(
+            self.pics_dir_path(), PMConsts.lazy_picinfo, PMConsts.scan_workers
+        )
+        self.picwatcher = make_picwatcher(self.picmanager)
+        self.picwatcher.start()
+        self.retention = PicRetention(self.picmanager, RetentionPolicy())
 
         self.displayer = Displayer(
             self.picmanager,
@@ -130,16 +260,44 @@ class PicMakerBase(ABC):
             self.reserve_task,
             self.on_debug,
             self.on_dump_picmanager,
+            self.on_print_stats,
+            self.on_retry_dead_letters,
             self.on_good,
             self.on_bad,
             self.whoami(),
         )
 
-        self.tasks: deque[PicMakerBase.TaskBlueprint] = deque()
-        self.crnt_task: PicMakerBase.TaskBlueprint = None
-
-        self.task_thread = threading.Thread(target=self.do_task, args=(), daemon=True)
-        self.task_thread.start()
+        self.pregen = PreGenScheduler()
+        self.batch_tuner = BatchTuner()
+        self.stage_timings = StageTimings()
+        self.picwriter = PicWriter(self.save_images)
+        self.sdbackends = SDBackendPool(PMConsts.max_inflight_per_server)
+        self.sdbackends.configure(self.displayer.srv_endpoints)
+        self.sdbackends.start()
+        self.progress_poller = ProgressPoller(self.sdbackends.progress)
+
+        self.tasks: TaskQueue[PicMakerBase.TaskBlueprint] = TaskQueue(
+            PicMakerBase.TaskBlueprint.coalesce,
+            lambda task: task.prompts,
+            PMConsts.task_ttl,
+        )
+        # 作業中のタスク (等価な別インスタンスと区別するため id をキーとする)
+        self.crnt_tasks: Dict[int, PicMakerBase.TaskBlueprint] = {}
+        self.crnt_tasks_lock = threading.Lock()
+        self.upscaler = Upscaler(
+            self.sdbackends.extra_single_image, self.is_gen_idle, self.on_upscaled
+        )
+        self.dead_letters: List[DeadLetter] = []
+        self.dead_letters_lock = threading.Lock()
+        self.dead_letters_version = 0
+        self.shown_dead_letters_version = 0
+
+        self.stop_event = threading.Event()
+        self.num_worker_restarts = 0
+        self.task_threads = [self.start_task_thread() for _ in range(PMConsts.task_workers)]
+        self.supervisor_thread = threading.Thread(target=self.supervise, daemon=True)
+        self.supervisor_thread.start()
+        self.dump_thread: threading.Thread | None = None
 
     def finalize(self) -> None:
         """
@@ -149,7 +307,16 @@ class PicMakerBase(ABC):
             return
 
         self.flags.is_task_thread_alive = False
-        self.task_thread.join()
+        self.stop_event.set()
+        self.supervisor_thread.join()
+        self.tasks.close()
+        for task_thread in self.task_threads:
+            task_thread.join()
+        self.picwriter.close()
+        self.upscaler.close()
+        self.progress_poller.close()
+        self.sdbackends.close()
+        self.picwatcher.stop()
         self.picmanager.finalize()
         self.displayer.destroy_config_window()
 
@@ -210,21 +377,92 @@ class PicMakerBase(ABC):
 
     def on_dump_picmanager(self) -> None:
         """
-        PicManager ダンプボタンハンドラ
+        PicManager ダンプボタンハンドラ\n
+        ダンプは GUI スレッドを塞がないよう別スレッドで標準出力へ逐次書き出す\n
+        ダンプ中の場合は何もしない
         """
-        print(self.picmanager.to_json())
+        if self.dump_thread is not None and self.dump_thread.is_alive():
+            return
+
+        self.dump_thread = threading.Thread(
+            target=self.picmanager.dump_json,
+            args=(sys.stdout, self.displayer.dump_jsonl),
+            daemon=True,
+        )
+        self.dump_thread.start()
+
+    def on_print_stats(self) -> None:
+        """
+        統計ボタンハンドラ\n
+        各種統計を標準出力へ書き出す
+        """
+        print(f"TaskQueue: pending={len(self.tasks)}, expired={self.tasks.num_expired}")
+        for backend_stats in self.sdbackends.stats():
+            print(f"SDBackend {backend_stats}")
+        num_alive = sum(task_thread.is_alive() for task_thread in self.task_threads)
+        print(
+            f"Workers: alive={num_alive}/{len(self.task_threads)}, "
+            f"restarts={self.num_worker_restarts}, dead_letters={len(self.dead_letters)}"
+        )
+        print(f"PicWriter: {self.picwriter}")
+        print(f"Upscaler: {self.upscaler}")
+        print(f"PreGen: {self.pregen}")
+        for tuning_stats in self.batch_tuner.lines():
+            print(f"BatchTuner {tuning_stats}")
+        for stage_stats in self.stage_timings.lines():
+            print(f"Stage {stage_stats}")
+        for step_stats in self.progress_poller.lines():
+            print(f"Step {step_stats}")
+
+    def on_retry_dead_letters(self) -> None:
+        """
+        再投入ボタンハンドラ\n
+        失敗タスク一覧のタスクをすべてタスクリストへ戻す
+        """
+        with self.dead_letters_lock:
+            dead_letters = self.dead_letters
+            self.dead_letters = []
+            self.dead_letters_version += 1
+
+        for dead_letter in dead_letters:
+            dead_letter.task.is_cancelled = False
+            dead_letter.task.is_interrupted = False
+            self.tasks.put(dead_letter.task, dead_letter.task.is_background)
 
     def on_good(self) -> None:
         """
-        GOOD ボタンハンドラ
+        GOOD ボタンハンドラ\n
+        表示中の画像のスコアを加算し (保持ポリシーによる削除の優先度が下がる),
+        アップスケール待ちキューへ投入する
+        """
+        picstats = self.picmanager.crnt_picstats
+        if picstats is None:
+            return
+
+        self.picmanager.set_score(picstats, picstats.score + 1)
+        self.upscaler.submit(picstats.path)
+
+    def on_upscaled(self, path: Path) -> None:
+        """
+        アップスケール画像の保存後処理 (アップスケールスレッドで実行される)\n
+        元画像のファイルサイズにアップスケール画像の分を反映し, 保持ポリシーを適用する
+
+        Args:
+            path (Path): 元画像のパス
         """
-        return
+        self.picmanager.refresh_size(path)
+        self.retention.enforce([path.parent.name])
 
     def on_bad(self) -> None:
         """
-        BAD ボタンハンドラ
+        BAD ボタンハンドラ\n
+        表示中の画像のスコアを減算する (保持ポリシーによる削除の優先度が上がる)
         """
-        return
+        picstats = self.picmanager.crnt_picstats
+        if picstats is None:
+            return
+
+        self.picmanager.set_score(picstats, picstats.score - 1)
 
     def refresh_clipboard(self) -> bool:
         """
@@ -280,6 +518,8 @@ class PicMakerBase(ABC):
 
         self.flags.is_new_stats = True
         self.crnt_stats = new_stats
+        if self.is_stats_enough_for_prompt():
+            self.pregen.mark_seen(self.crnt_stats["character"]["name"])
 
     @abstractmethod
     def is_stats_enough_for_prompt(self) -> bool:
@@ -292,9 +532,13 @@ class PicMakerBase(ABC):
         pass
 
     @abstractmethod
-    def make_pos_prompt(self) -> str:
+    def make_pos_prompt(self, stats: Dict[str, Any] | None = None) -> str:
         """
-        記録中ステータスからポジティブプロンプトを生成する
+        ステータスからポジティブプロンプトを生成する
+
+        Args:
+            stats (Dict[str, Any] | None, optional): ステータス, None の場合は記録中ステータス,
+                Defaults to None.
 
         Returns:
             str: プロンプト
@@ -302,54 +546,101 @@ class PicMakerBase(ABC):
         pass
 
     @abstractmethod
-    def make_neg_prompt(self) -> str:
+    def make_neg_prompt(self, stats: Dict[str, Any] | None = None) -> str:
         """
-        記録中ステータスからネガティブプロンプトを生成する
+        ステータスからネガティブプロンプトを生成する
+
+        Args:
+            stats (Dict[str, Any] | None, optional): ステータス, None の場合は記録中ステータス,
+                Defaults to None.
 
         Returns:
             str: プロンプト
         """
         pass
 
-    def make_json_for_txt2img(self) -> Dict:
+    def make_stats_for_chara(self, name: str) -> Dict[str, Any]:
         """
-        現在の Stable Diffusion 設定から txt2img エンドポイントにポストする json を生成する
+        キャラクタテーブルのキャラクタについて, プロンプト生成に用いるステータスを生成する\n
+        (先行生成用, キャラクタ名以外のステータスは持たない)
+
+        Args:
+            name (str): キャラクタ名
+
+        Returns:
+            Dict[str, Any]: ステータス
+        """
+        return {"character": {"name": name}}
+
+    def get_gen_settings(self) -> GenSettings:
+        """
+        現在の生成設定を取得する\n
+        生成数の自動調整が有効な場合, バッチサイズは現在の幅, 高さ, ステップ数について
+        BatchTuner が選んだ値とする
+        (タスクの統合で反復回数が上限まで増えても, 遅延の上限を超えないように選ぶ)
+
+        Returns:
+            GenSettings: 生成設定
+        """
+        steps = self.displayer.sd_steps
+        width = self.displayer.sd_width
+        height = self.displayer.sd_height
+        if self.displayer.auto_batch_size:
+            batch_size = self.batch_tuner.choose(
+                (width, height, steps), self.displayer.latency_budget, PMConsts.max_task_n_iter
+            )
+        else:
+            batch_size = self.displayer.sd_batch_size
+        return GenSettings(steps, width, height, batch_size)
+
+    def make_json_for_txt2img(self, task: PicMakerBase.TaskBlueprint) -> Dict:
+        """
+        タスクのプロンプトと生成設定から txt2img エンドポイントにポストする json を生成する
+
+        Args:
+            task (PicMakerBase.TaskBlueprint): 実行するタスク
 
         Returns:
             Dict: ポストする json
         """
         api_json = {}
-        api_json["prompt"] = self.crnt_task.pos_prompt
-        api_json["negative_prompt"] = self.crnt_task.neg_prompt
-        api_json["steps"] = self.displayer.sd_steps
-        api_json["batch_size"] = self.displayer.sd_batch_size
+        api_json["prompt"] = task.pos_prompt
+        api_json["negative_prompt"] = task.neg_prompt
+        api_json["steps"] = task.settings.steps
+        api_json["batch_size"] = task.settings.batch_size
+        api_json["n_iter"] = task.n_iter
         api_json["sampler_name"] = "DPM++ 2S a"
         api_json["scheduler"] = "Karras"
         api_json["cfg_scale"] = 7.0
         api_json["seed"] = -1
-        api_json["width"] = self.displayer.sd_width
-        api_json["height"] = self.displayer.sd_height
+        api_json["width"] = task.settings.width
+        api_json["height"] = task.settings.height
         return api_json if api_json["prompt"] and api_json["negative_prompt"] else None
 
-    def post_to_txt2img(self) -> Optional[Tuple[Any, Any]]:
+    def post_to_txt2img(
+        self,
+        task: PicMakerBase.TaskBlueprint,
+        on_server_elapsed: Callable[[float], None] | None = None,
+    ) -> Optional[Tuple[Any, Any]]:
         """
-        json を生成し Stable Diffusion txt2img エンドポイントへポストする
+        指定のタスクの json を生成し Stable Diffusion txt2img エンドポイントへポストする\n
+        ポスト先はバックエンドプールが未完了リクエスト数の少ないサーバから選ぶ\n
+        サーバへの同時送信数の上限に達している場合は空きが出るまで待機する
+
+        Args:
+            task (PicMakerBase.TaskBlueprint): 実行するタスク
+            on_server_elapsed (Callable[[float], None] | None, optional):
+                サーバでの所要時間 (s) を受け取るコールバック, Defaults to None.
 
         Returns:
             Tuple[Any, Any]: image フィールド, info フィールド, 失敗時は None
         """
-        payload = self.make_json_for_txt2img()
+        payload = self.make_json_for_txt2img(task)
         if not payload:
             return None
 
         # txt2img
-        response = requests.post(
-            f"http://{self.displayer.srv_ipaddr}:{self.displayer.srv_port}/sdapi/v1/txt2img",
-            json=payload,
-            timeout=60,
-        )
-        response.raise_for_status()
-        body = response.json()
+        body = self.sdbackends.txt2img(payload, task, on_server_elapsed)
         images = body.get("images", [])
         if not images:
             print("API response without images.")
@@ -410,9 +701,10 @@ class PicMakerBase(ABC):
 
     def save_images(self, images: Any, infos: Any) -> None:
         """
-        指定の画像群を保存する\n
+        指定の画像群を保存する (書き込みステージのスレッドで実行される)\n
         各画像には次回起動時にメタデータの再取得ができるよう, info 領域上のデータが埋め込まれる\n
-        保存が正常に完了した場合は画像リストの更新が行われる\n
+        埋め込みは PNG であればチャンク単位で行い, 画素データの展開, 再圧縮は行わない\n
+        保存が正常に完了した画像のみ画像リストへ追加され, その後保持ポリシーが適用される\n
         images か infos が None の場合は何もしない
 
         Args:
@@ -425,90 +717,331 @@ class PicMakerBase(ABC):
         if self.displayer.print_picinfo:
             dump_json(infos, "infos")
 
+        saved_paths: List[Path] = []
         for idx, image_data in enumerate(images):
             try:
-                b64 = image_data.split(",", 1)[-1]
-                image = Image.open(io.BytesIO(base64.b64decode(b64)))
+                with self.stage_timings.measure("decode"):
+                    b64 = image_data.split(",", 1)[-1]
+                    png = embed_pnginfo(base64.b64decode(b64), SDPngInfo(infos, idx))
 
-                pic_path = self.make_filepath(infos, idx)
-                if pic_path.parent and not pic_path.parent.exists():
-                    # 親ディレクトリが存在しない場合は作成する
-                    pic_path.parent.mkdir(parents=True, exist_ok=True)
+                with self.stage_timings.measure("write"):
+                    pic_path = self.make_filepath(infos, idx)
+                    if pic_path.parent and not pic_path.parent.exists():
+                        # 親ディレクトリが存在しない場合は作成する
+                        pic_path.parent.mkdir(parents=True, exist_ok=True)
 
-                image.save(str(pic_path), pnginfo=SDPngInfo(infos, idx))
+                    pic_path.write_bytes(png)
+                saved_paths.append(pic_path)
 
                 if self.displayer.print_images:
                     dump_json(PicStats(pic_path).info.to_dict(), "image")
             except Exception as e:
                 print(f"[WARN] Failed to save image idx={idx}: {e}")
 
-        self.picmanager.refresh_piclist()
+        with self.stage_timings.measure("index"):
+            self.picmanager.add_pics(saved_paths)
+            self.retention.enforce(path.parent.name for path in saved_paths)
 
-    def get_crnt_picstats_list(self) -> List[PicStats]:
+    def get_crnt_dirname(self) -> str:
         """
-        記録中ステータスに適合するディレクトリ下の画像群に関する PicStats のリストを取得する
+        記録中ステータスに適合するディレクトリ名を取得する
 
         Returns:
-            List[Path]: 画像パス群
+            str: ディレクトリ名
         """
-        pos_prompt = self.make_pos_prompt()
-        neg_prompt = self.make_neg_prompt()
-        return self.picmanager.get_picstats_list(
-            self.make_dirname_from_prompts(pos_prompt, neg_prompt)
-        )
+        return self.make_dirname_from_prompts(self.make_pos_prompt(), self.make_neg_prompt())
 
     def refresh_pic(self) -> None:
         """
-        表示可能な画像が複数個存在する場合にランダムで表示する\n
+        表示可能な画像が存在する場合に, 評価スコアに応じた確率で抽出して表示する\n
         存在しない場合は何もしない
         """
-        if not self.get_crnt_picstats_list():
-            return
-
-        self.displayer.update_pic(random.choice(self.get_crnt_picstats_list()))
+        self.displayer.update_pic(self.picmanager.pick_picstats(self.get_crnt_dirname()))
 
     def reserve_task(self) -> None:
         """
         新しいタスクを生成し, タスクリストに予約する\n
+        等価なタスクがすでにリストに存在する場合は, そのタスクに統合し反復回数を引き上げる\n
+        また, 新しいタスクのプロンプトの組 (表示中のキャラクタ) を優先して実行させる\n
+        注目が戻った作業中のタスクは, 中断を要求する前であれば取り消しを撤回する\n
+        予約した場合は, 作業中の先行生成タスクを取り消し, サーバで処理中であれば中断させる\n
         ただしプロンプト生成に十分なステータスが記録されていない,\n
-        すでにリストに存在する, あるいは作業中のタスクの場合は何もしない
+        あるいは取り消されていない作業中のタスクと等価な場合は何もしない
         """
         if not self.is_stats_enough_for_prompt():
             return
 
         new_task = PicMakerBase.TaskBlueprint(self)
-        if (new_task in self.tasks) or (new_task == self.crnt_task):
+        if self.tasks.focus != new_task.prompts:
+            self.tasks.set_focus(new_task.prompts)
+            if self.displayer.interrupt_stale:
+                self.cancel_tasks(lambda task: task.prompts != new_task.prompts)
+        with self.crnt_tasks_lock:
+            for task in self.crnt_tasks.values():
+                if task.prompts == new_task.prompts and not task.is_interrupted:
+                    task.is_cancelled = False
+            if any(task == new_task and not task.is_cancelled for task in self.crnt_tasks.values()):
+                return
+
+        self.tasks.put(new_task)
+        self.cancel_tasks(lambda task: task.is_background)
+
+    def is_gen_idle(self) -> bool:
+        """
+        生成が空いているか (タスクリストが空で, 作業中のタスクもない)
+
+        Returns:
+            bool: True: 空いている, False: 生成中あるいは生成待ち
+        """
+        if len(self.tasks) > 0:
+            return False
+        with self.crnt_tasks_lock:
+            return not self.crnt_tasks
+
+    def reserve_pregen_task(self) -> None:
+        """
+        GPU の空き時間に先行生成するタスクを予約する\n
+        タスクリストが空で, 作業中の先行生成タスクがない場合にのみ, 最低優先度で 1 つ予約する\n
+        アップスケール待ちの画像がある場合は, GOOD 評価に基づくアップスケールを優先して予約しない\n
+        対象は画像数が目標に満たないキャラクタから PreGenScheduler が選ぶ (デバッグ用は除く)\n
+        生成設定が入力途中などで不正な場合は予約しない
+        """
+        if len(self.tasks) > 0 or len(self.upscaler) > 0:
+            return
+        with self.crnt_tasks_lock:
+            if any(task.is_background for task in self.crnt_tasks.values()):
+                return
+        try:
+            settings = self.get_gen_settings()
+        except ValueError:
+            return
+
+        prompts: Dict[str, Tuple[str, str]] = {}
+        counts: Dict[str, int] = {}
+        for name in self.chara_tbl:
+            if PMConsts.charaname_substr_debug in name:
+                continue
+            stats = self.make_stats_for_chara(name)
+            pos_prompt = self.make_pos_prompt(stats)
+            neg_prompt = self.make_neg_prompt(stats)
+            if not pos_prompt or not neg_prompt:
+                continue
+            dirname = self.make_dirname_from_prompts(pos_prompt, neg_prompt)
+            prompts[name] = (pos_prompt, neg_prompt)
+            counts[name] = len(self.picmanager.get_picstats_list(dirname))
+
+        name = self.pregen.select(counts)
+        if name is None:
+            return
+
+        task = PicMakerBase.TaskBlueprint(None, *prompts[name], settings)
+        task.is_background = True
+        self.tasks.put(task, background=True)
+
+    def cancel_tasks(self, is_stale: Callable[[PicMakerBase.TaskBlueprint], bool]) -> None:
+        """
+        条件に合う作業中のタスクを取り消し, サーバで処理中であれば中断させる\n
+        中断の要求は GUI スレッドを塞がないよう別スレッドで行う
+
+        Args:
+            is_stale (Callable[[PicMakerBase.TaskBlueprint], bool]): 取り消すタスクかを判定する関数
+        """
+        with self.crnt_tasks_lock:
+            stale_tasks = [
+                task
+                for task in self.crnt_tasks.values()
+                if is_stale(task) and not task.is_cancelled
+            ]
+            for task in stale_tasks:
+                task.is_cancelled = True
+        if not stale_tasks:
             return
 
-        self.tasks.append(new_task)
+        threading.Thread(target=self.interrupt_cancelled_tasks, daemon=True).start()
+
+    def interrupt_cancelled_tasks(self) -> None:
+        """
+        取り消されたタスクを処理中のサーバに中断を要求する\n
+        中断を要求するタスクには, 取り消しの撤回と競合しないよう作業中タスクのロック下で印を付ける
+        """
+
+        def is_stale(task: PicMakerBase.TaskBlueprint) -> bool:
+            with self.crnt_tasks_lock:
+                if task.is_cancelled:
+                    task.is_interrupted = True
+                return task.is_cancelled
+
+        self.sdbackends.interrupt(is_stale)
+
+    def start_task_thread(self) -> threading.Thread:
+        """
+        ワーカスレッドを生成し, 開始する
+
+        Returns:
+            threading.Thread: ワーカスレッド
+        """
+        task_thread = threading.Thread(target=self.do_task, args=(), daemon=True)
+        task_thread.start()
+        return task_thread
+
+    def supervise(self) -> None:
+        """
+        ワーカスレッドの死活を監視し, 終了したワーカスレッドを再開する\n
+        終了処理が始まるまで周期的に実行される
+        """
+        while not self.stop_event.wait(PMConsts.supervise_interval):
+            for idx, task_thread in enumerate(self.task_threads):
+                if task_thread.is_alive() or not self.flags.is_task_thread_alive:
+                    continue
+                print(f"[WARN] Task worker {idx} died, restarting.")
+                self.num_worker_restarts += 1
+                self.task_threads[idx] = self.start_task_thread()
+
+    def add_dead_letter(self, task: PicMakerBase.TaskBlueprint, error: Exception) -> None:
+        """
+        タスクを失敗タスク一覧へ移す (保持数を超えた場合は古いものから捨てる)
+
+        Args:
+            task (PicMakerBase.TaskBlueprint): 失敗したタスク
+            error (Exception): 最後に発生した例外
+        """
+        print(f"[ERROR] Task failed {PMConsts.task_max_attempts} times, giving up: {error}")
+        with self.dead_letters_lock:
+            self.dead_letters.append(DeadLetter(task, str(error), datetime.now()))
+            del self.dead_letters[: -PMConsts.max_dead_letters]
+            self.dead_letters_version += 1
+
+    def refresh_retention_policy(self) -> None:
+        """
+        GUI で設定された保持数, 容量の上限を保持ポリシーへ反映する\n
+        (保持ポリシーは書き込みステージ等からも参照されるため, GUI スレッドで取得して差し替える)\n
+        入力途中などで不正な場合は現在のポリシーを維持する
+        """
+        try:
+            policy = RetentionPolicy(
+                self.displayer.max_pics_per_dir, self.displayer.max_total_bytes
+            )
+        except ValueError:
+            return
+        self.retention.policy = policy
+
+    def refresh_dead_letters(self) -> None:
+        """
+        失敗タスク一覧に変化があれば表示を更新する
+        """
+        with self.dead_letters_lock:
+            if self.dead_letters_version == self.shown_dead_letters_version:
+                return
+            self.shown_dead_letters_version = self.dead_letters_version
+            lines = [str(dead_letter) for dead_letter in self.dead_letters]
+        self.displayer.update_dead_letters(lines)
+
+    def refresh_progress(self) -> None:
+        """
+        生成進捗の表示を最新の進捗で更新する
+        """
+        progress = self.progress_poller.overall()
+        if progress is None:
+            self.displayer.update_progress(0.0, "待機中")
+            return
+        self.displayer.update_progress(
+            progress.progress, f"{progress.step}/{progress.steps} 残り {progress.eta:.0f} s"
+        )
 
     def do_task(self) -> None:
         """
-        タスクを実行する, つまり生成 -> 保存をアトミックに繰り返し実行する\n
-        タスクが空, すでに実行中タスクが存在する, あるいは生成が失敗した場合はスキップする\n
-        例外発生時はループを抜ける
+        タスクを実行する, つまり生成し, 結果を書き込みステージへ渡すことを繰り返す\n
+        ワーカスレッドごとに実行され, 生成の応答待ちと書き込みステージの保存処理とが並行する\n
+        タスクが空の場合は予約されるまで待機する\n
+        タスクキューのクローズ時はループを抜ける
         """
         while self.flags.is_task_thread_alive:
-            time.sleep(0.5)
-            if (not self.tasks) or (self.crnt_task is not None):
-                # ここでは実行中タスクを解除してはいけない
-                continue
+            task = self.tasks.get()
+            if task is None:
+                # クローズ済み
+                break
 
+            with self.crnt_tasks_lock:
+                self.crnt_tasks[id(task)] = task
             try:
-                self.crnt_task = self.tasks.popleft()
-                result = self.post_to_txt2img()
-                if result is None:
-                    # 生成失敗
-                    print("Failed to post.")
-                    continue
-                else:
-                    images, infos = result
-                    self.save_images(images, infos)
-            except Exception as e:
-                print("Any exception occurred: ", e)
-                break
+                self.run_task(task)
             finally:
-                self.crnt_task = None
+                with self.crnt_tasks_lock:
+                    del self.crnt_tasks[id(task)]
+
+    def run_task(self, task: PicMakerBase.TaskBlueprint) -> None:
+        """
+        タスクを実行する\n
+        例外が発生した場合は待機時間を倍にしながら再試行し,
+        最大試行回数を超えた場合は失敗タスク一覧へ移す\n
+        振り分け可能なサーバが存在しない場合は, 試行回数に数えずにサーバの復帰を待って再試行する\n
+        取り消された場合, あるいは終了処理が始まった場合は再試行しない
+
+        Args:
+            task (PicMakerBase.TaskBlueprint): 実行するタスク
+        """
+        attempt = 1
+        while True:
+            try:
+                self.exec_task(task)
+                return
+            except NoBackendAvailableError:
+                while not self.sdbackends.wait_available(PMConsts.supervise_interval):
+                    if task.is_cancelled or self.stop_event.is_set():
+                        return
+                continue
+            except Exception as e:
+                if task.is_cancelled or not self.flags.is_task_thread_alive:
+                    return
+                if attempt >= PMConsts.task_max_attempts:
+                    self.add_dead_letter(task, e)
+                    return
+                delay = min(
+                    PMConsts.task_retry_backoff * 2 ** (attempt - 1),
+                    PMConsts.task_retry_max_backoff,
+                )
+                print(
+                    f"[WARN] Task failed (attempt {attempt}/{PMConsts.task_max_attempts}), "
+                    f"retrying in {delay:.0f} s: {e}"
+                )
+                if self.stop_event.wait(delay):
+                    return
+                attempt += 1
+
+    def exec_task(self, task: PicMakerBase.TaskBlueprint) -> None:
+        """
+        タスクを 1 回試行する, つまり生成し, 結果を書き込みステージへ渡す\n
+        生成結果が空の場合はスキップする\n
+        取り消されたタスクの結果は破棄し, 後続の取り消されたタスクがあれば中断させる\n
+        バッチサイズの計測には, 他のリクエストの処理待ちを除いたサーバでの所要時間を用いる
+        (所要時間が得られなかった場合は記録しない)
+
+        Args:
+            task (PicMakerBase.TaskBlueprint): 実行するタスク
+        """
+        server_elapsed: List[float] = []
+        with self.stage_timings.measure("txt2img"):
+            result = self.post_to_txt2img(task, server_elapsed.append)
+        if task.is_cancelled:
+            print("Discarded a cancelled task.")
+            self.interrupt_cancelled_tasks()
+            return
+        if result is None:
+            # 生成失敗
+            print("Failed to post.")
+            return
+
+        images, infos = result
+        if server_elapsed:
+            settings = task.settings
+            self.batch_tuner.record(
+                settings.profile,
+                settings.batch_size,
+                len(images),
+                server_elapsed[0],
+                task.n_iter,
+            )
+        self.picwriter.submit(images, infos)
 
     def run_oneshot(self) -> None:
         """
@@ -520,14 +1053,20 @@ class PicMakerBase(ABC):
     def run_main(self) -> None:
         """
         メイン処理 (ステータス更新 -> 更新がある場合にタスクを予約 -> すでに存在する画像を表示)\n
-        Tkinter メインループにて周期的に呼び出される処理
+        Tkinter メインループにて周期的に呼び出される処理\n
+        先行生成が有効な場合は, GPU の空き時間に先行生成タスクも予約する
+        (注目キャラクタのタスクより先に予約しないよう, ステータス更新の後に行う)
         """
         try:
+            self.sdbackends.configure(self.displayer.srv_endpoints)
+            self.refresh_retention_policy()
+            self.refresh_dead_letters()
+            self.refresh_progress()
             self.refresh_stats()
-            if (not self.flags.is_new_stats) or (not self.is_stats_enough_for_prompt()):
-                return
-
-            self.run_oneshot()
+            if self.flags.is_new_stats and self.is_stats_enough_for_prompt():
+                self.run_oneshot()
+            if self.displayer.pregen:
+                self.reserve_pregen_task()
         finally:
             self.displayer.endpoint()
             self.displayer.switch_output_button_state(
@@ -233,16 +233,16 @@ class PicMakerReverse(PicMakerBase):
 
         return True
 
-    def make_pos_prompt(self) -> str:
-        name = self.crnt_stats["character"]["name"]
+    def make_pos_prompt(self, stats: Dict[str, Any] | None = None) -> str:
+        name = (stats or self.crnt_stats)["character"]["name"]
         pos_prompt = self.chara_tbl.get(name, "")
         if pos_prompt == "":
             return ""
         pos_prompt += ",best quality,masterpiece,absurdres,1girl,solo"
         return pos_prompt
 
-    def make_neg_prompt(self) -> str:
-        if PMConsts.charaname_substr_debug in self.crnt_stats["character"]["name"]:
+    def make_neg_prompt(self, stats: Dict[str, Any] | None = None) -> str:
+        if PMConsts.charaname_substr_debug in (stats or self.crnt_stats)["character"]["name"]:
             # デバッグステータス
             return "R debug"
 
@@ -1,272 +1,1104 @@
-"""
-画像管理クラス, 及びこれが包含するサブクラス群
-"""
-
-from __future__ import annotations
-
-import json
-import os
-from pathlib import Path
-from typing import Any, Dict, List
-
-from PIL import Image, PngImagePlugin
-
-
-class SDPngInfo(PngImagePlugin.PngInfo):
-    """
-    Stable Diffusion 特化の PngInfo
-    """
-
-    def __init__(self, infos: Any, idx: int):
-        """
-        コンストラクタ
-        PNG に付与する PNG Info を生成する\n
-        info 領域上のデータは "images" で削ぎ落とした時点でなくなるので, 再度の付与を行う\n
-        info 領域上のデータは同時生成した画像群に関する配列構造のため, インデックスの指定も必要
-
-        Args:
-            infos (Any): info 領域上のデータ
-            idx (int): 配列のインデックス
-        """
-        super().__init__()
-        self.add_text("prompt", infos.get("all_prompts", [])[idx])
-        self.add_text("negative_prompt", infos.get("all_negative_prompts", [])[idx])
-        self.add_text("steps", str(infos.get("steps", 0)))
-        self.add_text("sampler", infos.get("sampler_name", ""))
-        self.add_text(
-            "schedule_type",
-            infos.get("extra_generation_params", {}).get("Schedule type", ""),
-        )
-        self.add_text("cfg_scale", str(infos.get("cfg_scale", 0)))
-        self.add_text("seed", str(infos.get("all_seeds", [])[idx]))
-        self.add_text("width", str(infos.get("width", 0)))
-        self.add_text("height", str(infos.get("height", 0)))
-        self.add_text("sd_model_name", infos.get("sd_model_name", ""))
-        self.add_text("sd_model_hash", infos.get("sd_model_hash", ""))
-        self.add_text("clip_skip", str(infos.get("clip_skip", 0)))
-        self.add_text("parameters", infos.get("infotexts", [])[idx])
-
-
-class PicInfo:
-    """
-    画像のメタデータ
-    """
-
-    def __init__(self, image: Image):
-        """
-        コンストラクタ
-
-        Args:
-            image (Image): Open して得られる Image インスタンス
-        """
-        self.prompt = image.info.get("prompt")
-        self.negative_prompt = image.info.get("negative_prompt")
-        self.steps = int(image.info.get("steps"))
-        self.sampler = image.info.get("sampler")
-        self.schedule_type = image.info.get("schedule_type")
-        self.cfg_scale = float(image.info.get("cfg_scale"))
-        self.seed = int(image.info.get("seed"))
-        self.width = int(image.info.get("width"))
-        self.height = int(image.info.get("height"))
-        self.sd_model_name = image.info.get("sd_model_name")
-        self.sd_model_hash = image.info.get("sd_model_hash")
-        self.clip_skip = int(image.info.get("clip_skip"))
-        self.parameters = image.info.get("parameters")
-
-    def __eq__(self, other: PicInfo):
-        """
-        各値が指定の PicInfo のものと等しいか
-
-        Args:
-            other (PicInfo): 比較対象
-
-        Returns:
-            _type_: True: 等しい, False: 等しくない
-        """
-        return (
-            isinstance(other, PicInfo)
-            and self.prompt == other.prompt
-            and self.negative_prompt == other.negative_prompt
-            and self.steps == other.steps
-            and self.sampler == other.sampler
-            and self.schedule_type == other.schedule_type
-            and self.cfg_scale == other.cfg_scale
-            and self.seed == other.seed
-            and self.width == other.width
-            and self.height == other.height
-            and self.sd_model_name == other.sd_model_name
-            and self.sd_model_hash == other.sd_model_hash
-            and self.clip_skip == other.clip_skip
-            and self.parameters == other.parameters
-        )
-
-    def to_dict(self) -> Dict[str, Any]:
-        """
-        このクラスを Dict[str, Any] に変形する
-
-        Returns:
-            Dict[str, Any]: 変形後インスタンス
-        """
-        dict = {}
-        dict["prompt"] = self.prompt
-        dict["negative_prompt"] = self.negative_prompt
-        dict["steps"] = self.steps
-        dict["sampler"] = self.sampler
-        dict["schedule_type"] = self.schedule_type
-        dict["cfg_scale"] = self.cfg_scale
-        dict["seed"] = self.seed
-        dict["width"] = self.width
-        dict["height"] = self.height
-        dict["sd_model_name"] = self.sd_model_name
-        dict["sd_model_hash"] = self.sd_model_hash
-        dict["clip_skip"] = self.clip_skip
-        dict["parameters"] = self.parameters
-        return dict
-
-
-class PicStats:
-    """
-    画像情報 (パス, ディレクトリ名, ファイル名, メタデータ)
-    """
-
-    def __init__(self, path: Path):
-        """
-        コンストラクタ
-
-        Args:
-            path (Path): 画像のパス
-        """
-        self.path = path
-        self.dir = path.parent.name
-        self.name = path.name
-        try:
-            with Image.open(path) as image:
-                self.info = PicInfo(image)
-        except Exception as e:
-            print(f"Error PicStats {path}: {e}")
-
-    def __eq__(self, other: PicStats):
-        """
-        各値が指定の PicStats のものと等しいか
-
-        Args:
-            other (PicStats): 比較対象
-
-        Returns:
-            _type_: True: 等しい, False: 等しくない
-        """
-        return (
-            isinstance(other, PicStats)
-            and self.path == other.path
-            and self.dir == other.dir
-            and self.name == other.name
-            and self.info == other.info
-        )
-
-    def to_dict(self) -> Dict[str, Any]:
-        """
-        このクラスを Dict[str, Any] に変形する
-
-        Returns:
-            Dict[str, Any]: 変形後インスタンス
-        """
-        dict = {}
-        dict["path"] = str(self.path)
-        dict["dir"] = self.dir
-        dict["name"] = self.name
-        dict["info"] = self.info.to_dict()
-        return dict
-
-
-class PicManager:
-    """
-    画像監視クラス
-    """
-
-    def __init__(self, rootdir: Path):
-        """
-        コンストラクタ\n
-        piclist は ディレクトリ名とそのディレクトリに属するファイル名群を各成分とするリスト\n
-        注目中の画像を PicStats の形で記憶する(専ら表示中と同義)
-
-        Args:
-            rootdir (Path): 監視対象ディレクトリ
-        """
-        self.rootdir = rootdir
-        self.piclist: List[Dict[str, List[PicStats]]] = []
-        self.refresh_piclist()
-        self.crnt_picstats: PicStats | None = None
-
-    def finalize(self) -> None:
-        """
-        終了処理
-        """
-        return
-
-    def refresh_piclist(self) -> None:
-        """
-        監視対象ディレクトリ内の画像ファイルを PicStats の形で再帰的にリスト化する
-        """
-        self.piclist = []
-        for dirpath, _, filenames in os.walk(self.rootdir):
-            picstats: List[PicStats] = []
-            for filename in filenames:
-                if filename.lower().endswith(".png"):
-                    path = Path(dirpath) / filename
-                    picstats.append(PicStats(path))
-            if picstats:
-                dirname = Path(dirpath).name
-                self.piclist.append({dirname: picstats})
-
-    def get_picstats_list(self, dirname: str) -> List[PicStats]:
-        """
-        監視対象ディレクトリ内で指定のディレクトリ名に紐づく PicStats リストを取得する\n
-        存在しない場合は空リストを返す
-
-        Args:
-            dirname (str): ディレクトリ名
-
-        Returns:
-            List[PicStats]: PicStats リスト
-        """
-        for d in self.piclist:
-            if dirname in d:
-                return d[dirname]
-        return []
-
-    def next_picstats(self) -> PicStats:
-        """
-        PicStats リストにおいて, 注目中 PicStats の次のものを返す\n
-        末尾を注目中である場合はそれ自体を返す
-
-        Returns:
-            PicStats: 次の PicStats
-        """
-        picstats_list = self.get_picstats_list(self.crnt_picstats.dir)
-        idx = picstats_list.index(self.crnt_picstats)
-        return picstats_list[min(idx + 1, len(picstats_list) - 1)]
-
-    def prev_picstats(self) -> PicStats:
-        """
-        PicStats リストにおいて, 注目中 PicStats の前のものを返す\n
-        先頭を注目中である場合はそれ自体を返す
-
-        Returns:
-            PicStats: 前の PicStats
-        """
-        picstats_list = self.get_picstats_list(self.crnt_picstats.dir)
-        idx = picstats_list.index(self.crnt_picstats)
-        return picstats_list[max(idx - 1, 0)]
-
-    def to_json(self) -> Dict:
-        """
-        このクラスを json に成形する
-
-        Returns:
-            Dict: json
-        """
-        serializable = []
-        for d in self.piclist:
-            for dirname, stats_list in d.items():
-                serializable.append({"dir": dirname, "pics": [s.to_dict() for s in stats_list]})
-        return json.dumps(serializable, ensure_ascii=False, indent=2)
+"""
+画像管理クラス, 及びこれが包含するサブクラス群
+"""
+
+from __future__ import annotations
+
+import bisect
+import io
+import json
+import os
+import sys
+import textwrap
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Set, TextIO, Tuple
+
+from PIL import Image, PngImagePlugin
+
+from picindex import PicIndex, PicIndexRow
+from picsampler import FenwickSampler, score_to_weight
+from pngtext import PngConsts, read_png_text, splice_png_text
+
+
+@dataclass(frozen=True)
+class PicManagerConsts:
+    """
+    このモジュール関連の定数
+    """
+
+    # アップスケール画像のファイル名の接尾辞 (拡張子の直前)
+    upscaled_suffix: str = "-upscaled"
+
+
+def is_upscaled(name: str) -> bool:
+    """
+    アップスケール画像のファイル名か (アップスケール画像は画像リストの管理対象外)
+
+    Args:
+        name (str): ファイル名
+
+    Returns:
+        bool: True: アップスケール画像, False: それ以外
+    """
+    return Path(name).stem.endswith(PicManagerConsts.upscaled_suffix)
+
+
+def upscaled_path(path: Path) -> Path:
+    """
+    画像に対応するアップスケール画像のパス (同じディレクトリの <stem>-upscaled.png)
+
+    Args:
+        path (Path): 元画像のパス
+
+    Returns:
+        Path: アップスケール画像のパス
+    """
+    return path.with_name(f"{path.stem}{PicManagerConsts.upscaled_suffix}{path.suffix}")
+
+
+def upscaled_bytes(path: Path) -> int:
+    """
+    画像に対応するアップスケール画像のファイルサイズ
+
+    Args:
+        path (Path): 元画像のパス
+
+    Returns:
+        int: ファイルサイズ (byte), アップスケール画像が存在しない場合は 0
+    """
+    try:
+        return upscaled_path(path).stat().st_size
+    except OSError:
+        return 0
+
+
+def embed_pnginfo(data: bytes, pnginfo: PngImagePlugin.PngInfo) -> bytes:
+    """
+    画像のバイト列に PNG Info を付与した PNG のバイト列を得る\n
+    PNG の場合はチャンク単位で挿入し, 画素データの展開, 再圧縮は行わない\n
+    それ以外 (A1111 の samples_format が jpg, webp 等の場合) は PNG へ再エンコードして付与する
+
+    Args:
+        data (bytes): 画像のバイト列
+        pnginfo (PngImagePlugin.PngInfo): 付与する PNG Info
+
+    Returns:
+        bytes: PNG のバイト列
+    """
+    if data.startswith(PngConsts.signature):
+        return splice_png_text(data, pnginfo.chunks)
+
+    buf = io.BytesIO()
+    with Image.open(io.BytesIO(data)) as image:
+        image.save(buf, format="PNG", pnginfo=pnginfo)
+    return buf.getvalue()
+
+
+class SDPngInfo(PngImagePlugin.PngInfo):
+    """
+    Stable Diffusion 特化の PngInfo
+    """
+
+    def __init__(self, infos: Any, idx: int):
+        """
+        コンストラクタ
+        PNG に付与する PNG Info を生成する\n
+        info 領域上のデータは "images" で削ぎ落とした時点でなくなるので, 再度の付与を行う\n
+        info 領域上のデータは同時生成した画像群に関する配列構造のため, インデックスの指定も必要
+
+        Args:
+            infos (Any): info 領域上のデータ
+            idx (int): 配列のインデックス
+        """
+        super().__init__()
+        self.add_text("prompt", infos.get("all_prompts", [])[idx])
+        self.add_text("negative_prompt", infos.get("all_negative_prompts", [])[idx])
+        self.add_text("steps", str(infos.get("steps", 0)))
+        self.add_text("sampler", infos.get("sampler_name", ""))
+        self.add_text(
+            "schedule_type",
+            infos.get("extra_generation_params", {}).get("Schedule type", ""),
+        )
+        self.add_text("cfg_scale", str(infos.get("cfg_scale", 0)))
+        self.add_text("seed", str(infos.get("all_seeds", [])[idx]))
+        self.add_text("width", str(infos.get("width", 0)))
+        self.add_text("height", str(infos.get("height", 0)))
+        self.add_text("sd_model_name", infos.get("sd_model_name", ""))
+        self.add_text("sd_model_hash", infos.get("sd_model_hash", ""))
+        self.add_text("clip_skip", str(infos.get("clip_skip", 0)))
+        self.add_text("parameters", infos.get("infotexts", [])[idx])
+
+
+class PicGenParams:
+    """
+    画像のメタデータのうち, 同一プロンプトディレクトリの画像間で共通の生成設定\n
+    同値のインスタンスはプールで 1 つに集約され, 各 PicInfo から共有される\n
+    プールは弱参照で保持し, 参照する PicInfo がなくなったインスタンスは破棄される
+    """
+
+    __slots__ = (
+        "prompt",
+        "negative_prompt",
+        "steps",
+        "sampler",
+        "schedule_type",
+        "cfg_scale",
+        "width",
+        "height",
+        "sd_model_name",
+        "sd_model_hash",
+        "clip_skip",
+        "parameters_prefix",
+        "__weakref__",
+    )
+
+    # 生成設定の値の組をキーとするインスタンスのプール (削除された画像の分が残らないよう弱参照)
+    pool: weakref.WeakValueDictionary[tuple, PicGenParams] = weakref.WeakValueDictionary()
+
+    def __init__(self, key: tuple):
+        """
+        コンストラクタ\n
+        直接呼び出さず, intern() を用いること
+
+        Args:
+            key (tuple): 生成設定の値の組 (__slots__ の先頭から parameters_prefix の手前まで)
+        """
+        (
+            self.prompt,
+            self.negative_prompt,
+            self.steps,
+            self.sampler,
+            self.schedule_type,
+            self.cfg_scale,
+            self.width,
+            self.height,
+            self.sd_model_name,
+            self.sd_model_hash,
+            self.clip_skip,
+        ) = key
+        # infotext (parameters) は "<prompt>\nNegative prompt: <negative_prompt>\n<設定行>" の形式
+        self.parameters_prefix = f"{self.prompt}\nNegative prompt: {self.negative_prompt}\n"
+
+    @classmethod
+    def intern(cls, info: Mapping[str, Any]) -> PicGenParams:
+        """
+        メタデータから生成設定を取得する\n
+        同値のインスタンスがプールに存在する場合はそれを返す
+
+        Args:
+            info (Mapping[str, Any]): メタデータ
+
+        Returns:
+            PicGenParams: 生成設定
+        """
+        key = (
+            info.get("prompt"),
+            info.get("negative_prompt"),
+            int(info.get("steps")),
+            info.get("sampler"),
+            info.get("schedule_type"),
+            float(info.get("cfg_scale")),
+            int(info.get("width")),
+            int(info.get("height")),
+            info.get("sd_model_name"),
+            info.get("sd_model_hash"),
+            int(info.get("clip_skip")),
+        )
+        gen_params = cls.pool.get(key)
+        if gen_params is None:
+            gen_params = cls.pool.setdefault(key, cls(key))
+        return gen_params
+
+
+class PicInfo:
+    """
+    画像のメタデータ\n
+    共通の生成設定は PicGenParams として共有し, 画像ごとに異なる値 (シード, infotext) のみ保持する\n
+    infotext は生成設定と重複する先頭部分 (プロンプト) を省いて保持する
+    """
+
+    __slots__ = ("gen_params", "seed", "parameters_suffix", "is_parameters_elided")
+
+    def __init__(self, info: Mapping[str, Any]):
+        """
+        コンストラクタ\n
+        PNG のテキストチャンクの内容, もしくは to_dict() の結果から生成する
+
+        Args:
+            info (Mapping[str, Any]): メタデータ
+        """
+        self.gen_params = PicGenParams.intern(info)
+        self.seed = int(info.get("seed"))
+        parameters = info.get("parameters")
+        prefix = self.gen_params.parameters_prefix
+        self.is_parameters_elided = isinstance(parameters, str) and parameters.startswith(prefix)
+        self.parameters_suffix = (
+            parameters[len(prefix) :] if self.is_parameters_elided else parameters
+        )
+
+    @property
+    def prompt(self) -> str:
+        """
+        ポジティブプロンプト (同一生成設定の画像間で共有)
+
+        Returns:
+            str: ポジティブプロンプト
+        """
+        return self.gen_params.prompt
+
+    @property
+    def negative_prompt(self) -> str:
+        """
+        ネガティブプロンプト (同一生成設定の画像間で共有)
+
+        Returns:
+            str: ネガティブプロンプト
+        """
+        return self.gen_params.negative_prompt
+
+    @property
+    def steps(self) -> int:
+        """
+        ステップ数 (同一生成設定の画像間で共有)
+
+        Returns:
+            int: ステップ数
+        """
+        return self.gen_params.steps
+
+    @property
+    def sampler(self) -> str:
+        """
+        サンプラー (同一生成設定の画像間で共有)
+
+        Returns:
+            str: サンプラー
+        """
+        return self.gen_params.sampler
+
+    @property
+    def schedule_type(self) -> str:
+        """
+        スケジューラ (同一生成設定の画像間で共有)
+
+        Returns:
+            str: スケジューラ
+        """
+        return self.gen_params.schedule_type
+
+    @property
+    def cfg_scale(self) -> float:
+        """
+        CFG スケール (同一生成設定の画像間で共有)
+
+        Returns:
+            float: CFG スケール
+        """
+        return self.gen_params.cfg_scale
+
+    @property
+    def width(self) -> int:
+        """
+        幅 (同一生成設定の画像間で共有)
+
+        Returns:
+            int: 幅
+        """
+        return self.gen_params.width
+
+    @property
+    def height(self) -> int:
+        """
+        高さ (同一生成設定の画像間で共有)
+
+        Returns:
+            int: 高さ
+        """
+        return self.gen_params.height
+
+    @property
+    def sd_model_name(self) -> str:
+        """
+        モデル名 (同一生成設定の画像間で共有)
+
+        Returns:
+            str: モデル名
+        """
+        return self.gen_params.sd_model_name
+
+    @property
+    def sd_model_hash(self) -> str:
+        """
+        モデルハッシュ (同一生成設定の画像間で共有)
+
+        Returns:
+            str: モデルハッシュ
+        """
+        return self.gen_params.sd_model_hash
+
+    @property
+    def clip_skip(self) -> int:
+        """
+        Clip skip (同一生成設定の画像間で共有)
+
+        Returns:
+            int: Clip skip
+        """
+        return self.gen_params.clip_skip
+
+    @property
+    def parameters(self) -> str:
+        """
+        infotext (省いた先頭部分を復元して返す)
+
+        Returns:
+            str: infotext
+        """
+        if self.is_parameters_elided:
+            return self.gen_params.parameters_prefix + self.parameters_suffix
+        return self.parameters_suffix
+
+    def __eq__(self, other: PicInfo):
+        """
+        各値が指定の PicInfo のものと等しいか
+
+        Args:
+            other (PicInfo): 比較対象
+
+        Returns:
+            _type_: True: 等しい, False: 等しくない
+        """
+        return (
+            isinstance(other, PicInfo)
+            and self.prompt == other.prompt
+            and self.negative_prompt == other.negative_prompt
+            and self.steps == other.steps
+            and self.sampler == other.sampler
+            and self.schedule_type == other.schedule_type
+            and self.cfg_scale == other.cfg_scale
+            and self.seed == other.seed
+            and self.width == other.width
+            and self.height == other.height
+            and self.sd_model_name == other.sd_model_name
+            and self.sd_model_hash == other.sd_model_hash
+            and self.clip_skip == other.clip_skip
+            and self.parameters == other.parameters
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        このクラスを Dict[str, Any] に変形する
+
+        Returns:
+            Dict[str, Any]: 変形後インスタンス
+        """
+        dict = {}
+        dict["prompt"] = self.prompt
+        dict["negative_prompt"] = self.negative_prompt
+        dict["steps"] = self.steps
+        dict["sampler"] = self.sampler
+        dict["schedule_type"] = self.schedule_type
+        dict["cfg_scale"] = self.cfg_scale
+        dict["seed"] = self.seed
+        dict["width"] = self.width
+        dict["height"] = self.height
+        dict["sd_model_name"] = self.sd_model_name
+        dict["sd_model_hash"] = self.sd_model_hash
+        dict["clip_skip"] = self.clip_skip
+        dict["parameters"] = self.parameters
+        return dict
+
+
+class PicStats:
+    """
+    画像情報 (パス, ディレクトリ名, ファイル名, ファイルサイズ, 評価スコア, メタデータ)\n
+    ディレクトリ名は同一ディレクトリの画像間で共有する\n
+    ファイルサイズはアップスケール画像の分を含む (保持ポリシーの容量上限を実際の使用量に合わせる)
+    """
+
+    __slots__ = ("path", "dir", "name", "size", "score", "_info", "_loader", "_is_loaded")
+
+    def __init__(
+        self,
+        path: Path,
+        info: PicInfo | None = None,
+        loader: Callable[[Path], PicInfo | None] | None = None,
+        size: int = 0,
+        score: int = 0,
+    ):
+        """
+        コンストラクタ\n
+        info が指定されている場合はそれをメタデータとする\n
+        loader が指定されている場合はパス情報のみ記録し,\n
+        メタデータは初回参照時に loader で取得する\n
+        いずれも指定されていない場合は画像を Open してメタデータを取得する
+
+        Args:
+            path (Path): 画像のパス
+            info (PicInfo | None, optional): メタデータ, Defaults to None.
+            loader (Callable[[Path], PicInfo | None] | None, optional):
+                メタデータの遅延取得関数, Defaults to None.
+            size (int, optional): ファイルサイズ (アップスケール画像を含む, byte),
+                Defaults to 0.
+            score (int, optional): 評価スコア, Defaults to 0.
+        """
+        self.path = path
+        self.dir = sys.intern(path.parent.name)
+        self.name = path.name
+        self.size = size
+        self.score = score
+        self._info = info
+        self._loader = loader
+        self._is_loaded = info is not None
+        if not self._is_loaded and loader is None:
+            self._info = PicStats.open_picinfo(path)
+            self._is_loaded = True
+
+    @staticmethod
+    def open_picinfo(path: Path) -> PicInfo | None:
+        """
+        画像のテキストチャンクを読み取ってメタデータを取得する\n
+        画素データのデコーダは生成しない
+
+        Args:
+            path (Path): 画像のパス
+
+        Returns:
+            PicInfo | None: メタデータ, 失敗時は None
+        """
+        try:
+            return PicInfo(read_png_text(path))
+        except Exception as e:
+            print(f"Error PicStats {path}: {e}")
+            return None
+
+    @property
+    def info(self) -> PicInfo | None:
+        """
+        メタデータ\n
+        未取得の場合はここで取得し, 以降は取得結果 (失敗を含む) を使い回す
+
+        Returns:
+            PicInfo | None: メタデータ, 取得失敗時は None
+        """
+        if not self._is_loaded:
+            self._info = self._loader(self.path)
+            self._is_loaded = True
+            self._loader = None
+        return self._info
+
+    @property
+    def is_loaded(self) -> bool:
+        """
+        メタデータを取得済みか
+
+        Returns:
+            bool: True: 取得済み, False: 未取得
+        """
+        return self._is_loaded
+
+    def __eq__(self, other: PicStats):
+        """
+        各値が指定の PicStats のものと等しいか
+
+        Args:
+            other (PicStats): 比較対象
+
+        Returns:
+            _type_: True: 等しい, False: 等しくない
+        """
+        return (
+            isinstance(other, PicStats)
+            and self.path == other.path
+            and self.dir == other.dir
+            and self.name == other.name
+            and self.info == other.info
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        このクラスを Dict[str, Any] に変形する
+
+        Returns:
+            Dict[str, Any]: 変形後インスタンス
+        """
+        dict = {}
+        dict["path"] = str(self.path)
+        dict["dir"] = self.dir
+        dict["name"] = self.name
+        dict["size"] = self.size
+        dict["score"] = self.score
+        dict["info"] = self.info.to_dict() if self.info is not None else None
+        return dict
+
+
+@dataclass(frozen=True)
+class ScanStats:
+    """
+    全走査の計測結果
+    """
+
+    # 走査したファイル数
+    files: int
+    # 走査したディレクトリ数
+    dirs: int
+    # 並列数
+    workers: int
+    # 所要時間 (s)
+    elapsed: float
+
+    @property
+    def files_per_sec(self) -> float:
+        """
+        1 秒あたりの走査ファイル数
+
+        Returns:
+            float: 走査ファイル数 / s
+        """
+        return self.files / self.elapsed if self.elapsed > 0 else 0.0
+
+    def __str__(self) -> str:
+        return (
+            f"Scanned {self.files} files in {self.dirs} dirs with {self.workers} workers: "
+            f"{self.elapsed:.2f} s, {self.files_per_sec:.0f} files/s"
+        )
+
+
+class PicDir:
+    """
+    ディレクトリ単位の PicStats 列\n
+    ファイル名 (生成日時から始まる) の昇順で安定に整列され, 位置による参照を O(1) で行える\n
+    評価スコアを重みとする抽出器を併せて保持し, 挿入, 削除時に差分更新する
+    """
+
+    def __init__(self, dirname: str):
+        """
+        コンストラクタ
+
+        Args:
+            dirname (str): ディレクトリ名
+        """
+        self.dirname = dirname
+        self.names: List[str] = []
+        self.stats: List[PicStats] = []
+        self.total_bytes = 0
+        self.sampler: FenwickSampler[str] = FenwickSampler()
+
+    def __len__(self) -> int:
+        return len(self.stats)
+
+    def __getitem__(self, idx: int) -> PicStats:
+        return self.stats[idx]
+
+    def index_of(self, name: str) -> int | None:
+        """
+        指定のファイル名の位置を二分探索で取得する
+
+        Args:
+            name (str): ファイル名
+
+        Returns:
+            int | None: 位置, 存在しない場合は None
+        """
+        idx = bisect.bisect_left(self.names, name)
+        if idx < len(self.names) and self.names[idx] == name:
+            return idx
+        return None
+
+    def insert(self, stats: PicStats) -> Tuple[int, bool]:
+        """
+        PicStats を整列順を保って挿入する\n
+        同名のものが存在する場合は置き換える
+
+        Args:
+            stats (PicStats): 挿入する PicStats
+
+        Returns:
+            Tuple[int, bool]: 挿入位置, 置き換えであったか
+        """
+        idx = bisect.bisect_left(self.names, stats.name)
+        self.total_bytes += stats.size
+        self.sampler.set(stats.name, score_to_weight(stats.score))
+        if idx < len(self.names) and self.names[idx] == stats.name:
+            self.total_bytes -= self.stats[idx].size
+            self.stats[idx] = stats
+            return idx, True
+        self.names.insert(idx, stats.name)
+        self.stats.insert(idx, stats)
+        return idx, False
+
+    def remove(self, name: str) -> int | None:
+        """
+        指定のファイル名の PicStats を削除する
+
+        Args:
+            name (str): ファイル名
+
+        Returns:
+            int | None: 削除した位置, 存在しない場合は None
+        """
+        idx = self.index_of(name)
+        if idx is None:
+            return None
+        self.total_bytes -= self.stats[idx].size
+        self.sampler.remove(name)
+        del self.names[idx]
+        del self.stats[idx]
+        return idx
+
+
+class PicManager:
+    """
+    画像監視クラス
+    """
+
+    def __init__(self, rootdir: Path, lazy: bool = False, scan_workers: int = 1):
+        """
+        コンストラクタ\n
+        piclist は ディレクトリ名をキー, そのディレクトリに属する PicDir を値とする Dict\n
+        piclist は永続インデックスをもとに構築され, 新規または更新された画像のみ Open される\n
+        lazy が True の場合, 構築時はパス情報のみ記録し, メタデータは初回参照時に取得する\n
+        注目中の画像はディレクトリ名と PicDir 上の位置 (カーソル) の形で記憶する(専ら表示中と同義)\n
+        piclist とカーソルは複数スレッドから操作されるため lock で保護する
+
+        Args:
+            rootdir (Path): 監視対象ディレクトリ
+            lazy (bool, optional): メタデータを遅延取得するか, Defaults to False.
+            scan_workers (int, optional): 全走査時の並列数, Defaults to 1.
+        """
+        self.rootdir = rootdir
+        self.lazy = lazy
+        self.scan_workers = scan_workers
+        self.scan_stats: ScanStats | None = None
+        self.lock = threading.RLock()
+        self.index = PicIndex(rootdir)
+        self.piclist: Dict[str, PicDir] = {}
+        self.crnt_dir: str | None = None
+        self.crnt_idx: int = 0
+        self.refresh_piclist()
+
+    def finalize(self) -> None:
+        """
+        終了処理
+        """
+        self.index.close()
+
+    @property
+    def crnt_picstats(self) -> PicStats | None:
+        """
+        注目中の PicStats
+
+        Returns:
+            PicStats | None: 注目中の PicStats, 存在しない場合は None
+        """
+        with self.lock:
+            picdir = self.piclist.get(self.crnt_dir)
+            if not picdir:
+                return None
+            return picdir[self.crnt_idx]
+
+    @crnt_picstats.setter
+    def crnt_picstats(self, picstats: PicStats | None) -> None:
+        """
+        注目中の PicStats を設定し, カーソルを移動する\n
+        piclist に存在しない PicStats の場合は注目を解除する
+
+        Args:
+            picstats (PicStats | None): 注目する PicStats
+        """
+        with self.lock:
+            picdir = self.piclist.get(picstats.dir) if picstats is not None else None
+            idx = picdir.index_of(picstats.name) if picdir is not None else None
+            if idx is None:
+                self.crnt_dir = None
+                self.crnt_idx = 0
+                return
+            self.crnt_dir = picstats.dir
+            self.crnt_idx = idx
+
+    def load_picinfo(self, path: Path) -> PicInfo | None:
+        """
+        指定のパスのメタデータを取得する (遅延取得用)\n
+        インデックス上のレコードが最新の場合はそれを用い, そうでない場合は画像を Open して登録する
+
+        Args:
+            path (Path): 画像のパス
+
+        Returns:
+            PicInfo | None: メタデータ, 失敗時は None
+        """
+        try:
+            stat = path.stat()
+        except OSError as e:
+            print(f"Error PicManager {path}: {e}")
+            return None
+        row = self.index.get(path)
+        if row is not None and row.is_fresh(stat.st_mtime_ns, stat.st_size):
+            return PicInfo(row.info)
+        info = PicStats.open_picinfo(path)
+        if info is not None:
+            self.index.upsert(
+                [PicIndexRow(str(path), stat.st_mtime_ns, stat.st_size, info.to_dict())]
+            )
+        return info
+
+    def load_picstats(
+        self, path: Path, row: PicIndexRow | None, score: int = 0
+    ) -> Tuple[PicStats | None, PicIndexRow | None]:
+        """
+        指定のパスの PicStats を生成する\n
+        遅延取得の場合はパス情報のみの PicStats を返す\n
+        インデックス上のレコードが最新 (最終更新時刻とサイズが一致) の場合はそのメタデータを用い,\n
+        そうでない場合は画像を Open し, 登録すべき新しいレコードも返す\n
+        ファイルが存在しない場合は (None, None) を返す
+
+        Args:
+            path (Path): 画像のパス
+            row (PicIndexRow | None): インデックス上のレコード
+            score (int, optional): 評価スコア, Defaults to 0.
+
+        Returns:
+            Tuple[PicStats | None, PicIndexRow | None]: PicStats, 新しいレコード
+        """
+        try:
+            stat = path.stat()
+        except OSError as e:
+            print(f"Error PicManager {path}: {e}")
+            return None, None
+        size = stat.st_size + upscaled_bytes(path)
+        if self.lazy:
+            return PicStats(path, loader=self.load_picinfo, size=size, score=score), None
+        if row is not None and row.is_fresh(stat.st_mtime_ns, stat.st_size):
+            return PicStats(path, PicInfo(row.info), size=size, score=score), None
+        stats = PicStats(path, size=size, score=score)
+        if stats.info is None:
+            return stats, None
+        return stats, PicIndexRow(str(path), stat.st_mtime_ns, stat.st_size, stats.info.to_dict())
+
+    def scan_dir(
+        self,
+        dirpath: Path,
+        filenames: List[str],
+        rows: Dict[str, PicIndexRow],
+        scores: Dict[str, int],
+    ) -> Tuple[PicDir, List[PicIndexRow]]:
+        """
+        1 ディレクトリ分の画像ファイルを PicDir の形でリスト化する (全走査の作業単位)
+
+        Args:
+            dirpath (Path): ディレクトリのパス
+            filenames (List[str]): ディレクトリ内のファイル名群
+            rows (Dict[str, PicIndexRow]): インデックス上のレコード群
+            scores (Dict[str, int]): インデックス上のスコア群
+
+        Returns:
+            Tuple[PicDir, List[PicIndexRow]]: PicDir, 登録すべき新しいレコード群
+        """
+        picdir = PicDir(dirpath.name)
+        new_rows: List[PicIndexRow] = []
+        for filename in filenames:
+            path = dirpath / filename
+            stats, new_row = self.load_picstats(path, rows.get(str(path)), scores.get(str(path), 0))
+            if stats is not None:
+                picdir.insert(stats)
+            if new_row is not None:
+                new_rows.append(new_row)
+        return picdir, new_rows
+
+    def refresh_piclist(self, workers: int | None = None) -> None:
+        """
+        監視対象ディレクトリ内の画像ファイルを PicStats の形で再帰的にリスト化する\n
+        全画像の再走査となるため, 明示的な再構築が必要な場合のみ呼び出すこと\n
+        ディレクトリ単位で workers 個のスレッドに分配し, 結果はディレクトリ名順に統合する\n
+        存在しなくなった画像のレコードはインデックスから削除する\n
+        注目中の画像が再走査後も存在する場合はカーソルを維持する\n
+        走査中は lock を保持せず, 走査結果への差し替えのみ lock 下で行う
+
+        Args:
+            workers (int | None, optional): 並列数, None の場合は scan_workers. Defaults to None.
+        """
+        workers = max(1, workers or self.scan_workers)
+        start = time.perf_counter()
+        stale_paths = set(self.index.paths())
+        rows = {} if self.lazy else self.index.load_all()
+        scores = self.index.load_scores()
+        jobs: List[Tuple[Path, List[str]]] = []
+        for dirpath, _, filenames in os.walk(self.rootdir):
+            filenames = [f for f in filenames if f.lower().endswith(".png") and not is_upscaled(f)]
+            if filenames:
+                jobs.append((Path(dirpath), filenames))
+                stale_paths.difference_update(str(Path(dirpath) / f) for f in filenames)
+        jobs.sort(key=lambda job: (job[0].name, str(job[0])))
+
+        if workers == 1:
+            results = [
+                self.scan_dir(dirpath, filenames, rows, scores) for dirpath, filenames in jobs
+            ]
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                results = list(
+                    executor.map(lambda job: self.scan_dir(job[0], job[1], rows, scores), jobs)
+                )
+
+        new_rows: List[PicIndexRow] = []
+        piclist: Dict[str, PicDir] = {}
+        for picdir, dir_rows in results:
+            new_rows.extend(dir_rows)
+            if not picdir:
+                continue
+            if picdir.dirname in piclist:
+                for stats in picdir.stats:
+                    piclist[picdir.dirname].insert(stats)
+            else:
+                piclist[picdir.dirname] = picdir
+        self.index.upsert(new_rows)
+        self.index.delete(stale_paths)
+        with self.lock:
+            crnt_picstats = self.crnt_picstats
+            self.piclist = piclist
+            self.crnt_picstats = crnt_picstats
+
+        self.scan_stats = ScanStats(
+            sum(len(filenames) for _, filenames in jobs),
+            len(jobs),
+            workers,
+            time.perf_counter() - start,
+        )
+        print(self.scan_stats)
+
+    def add_pics(self, paths: Iterable[Path]) -> None:
+        """
+        指定の画像群を piclist とインデックスに追加する\n
+        すでに piclist に存在する画像は置き換える, アップスケール画像は追加しない
+
+        Args:
+            paths (Iterable[Path]): 画像のパス群
+        """
+        new_stats: List[PicStats] = []
+        new_rows: List[PicIndexRow] = []
+        for path in paths:
+            if is_upscaled(path.name):
+                continue
+            stats, new_row = self.load_picstats(path, None)
+            if stats is not None:
+                new_stats.append(stats)
+            if new_row is not None:
+                new_rows.append(new_row)
+        with self.lock:
+            for stats in new_stats:
+                picdir = self.piclist.setdefault(stats.dir, PicDir(stats.dir))
+                idx, replaced = picdir.insert(stats)
+                if not replaced and stats.dir == self.crnt_dir and idx <= self.crnt_idx:
+                    self.crnt_idx += 1
+        self.index.upsert(new_rows)
+
+    def remove_pics(self, paths: Iterable[Path]) -> None:
+        """
+        指定の画像群を piclist とインデックスから削除する\n
+        ファイル自体は削除しない\n
+        注目中の画像が削除された場合は同ディレクトリ内の隣接する画像へ注目を移す
+
+        Args:
+            paths (Iterable[Path]): 画像のパス群
+        """
+        paths = list(paths)
+        with self.lock:
+            for path in paths:
+                dirname = path.parent.name
+                picdir = self.piclist.get(dirname)
+                if picdir is None:
+                    continue
+                idx = picdir.remove(path.name)
+                if idx is None:
+                    continue
+                if not picdir:
+                    del self.piclist[dirname]
+                if dirname != self.crnt_dir:
+                    continue
+                if not picdir:
+                    self.crnt_picstats = None
+                elif idx < self.crnt_idx or self.crnt_idx == len(picdir):
+                    self.crnt_idx -= 1
+        self.index.delete(str(path) for path in paths)
+
+    def get_picstats_list(self, dirname: str) -> List[PicStats]:
+        """
+        監視対象ディレクトリ内で指定のディレクトリ名に紐づく PicStats リストを取得する\n
+        存在しない場合は空リストを返す\n
+        返り値は piclist の内部状態であるため, 変更してはならない
+
+        Args:
+            dirname (str): ディレクトリ名
+
+        Returns:
+            List[PicStats]: PicStats リスト
+        """
+        with self.lock:
+            picdir = self.piclist.get(dirname)
+            return picdir.stats if picdir is not None else []
+
+    def paths(self) -> Set[Path]:
+        """
+        piclist 上の全画像のパスを取得する
+
+        Returns:
+            Set[Path]: パス群
+        """
+        with self.lock:
+            return {stats.path for picdir in self.piclist.values() for stats in picdir.stats}
+
+    def contains(self, path: Path) -> bool:
+        """
+        指定のパスの画像が piclist 上に存在するか
+
+        Args:
+            path (Path): 画像のパス
+
+        Returns:
+            bool: True: 存在する, False: 存在しない
+        """
+        with self.lock:
+            picdir = self.piclist.get(path.parent.name)
+            return picdir is not None and picdir.index_of(path.name) is not None
+
+    @property
+    def total_bytes(self) -> int:
+        """
+        piclist 上の全画像の合計ファイルサイズ
+
+        Returns:
+            int: 合計ファイルサイズ (byte)
+        """
+        with self.lock:
+            return sum(picdir.total_bytes for picdir in self.piclist.values())
+
+    def refresh_size(self, path: Path) -> None:
+        """
+        指定の画像のファイルサイズ (アップスケール画像を含む) を再取得し, 合計に反映する\n
+        piclist に存在しない画像の場合は何もしない
+
+        Args:
+            path (Path): 画像のパス
+        """
+        try:
+            size = path.stat().st_size + upscaled_bytes(path)
+        except OSError:
+            return
+        with self.lock:
+            picdir = self.piclist.get(path.parent.name)
+            idx = None if picdir is None else picdir.index_of(path.name)
+            if idx is None:
+                return
+            picdir.total_bytes += size - picdir[idx].size
+            picdir[idx].size = size
+
+    def set_score(self, picstats: PicStats, score: int) -> None:
+        """
+        指定の PicStats の評価スコアを更新し, インデックスへ反映する
+
+        Args:
+            picstats (PicStats): 対象の PicStats
+            score (int): スコア
+        """
+        # インデックス上にレコードを用意する (遅延取得時はここで登録される)
+        if picstats.info is None:
+            return
+        with self.lock:
+            picstats.score = score
+            picdir = self.piclist.get(picstats.dir)
+            if picdir is not None and picdir.index_of(picstats.name) is not None:
+                picdir.sampler.set(picstats.name, score_to_weight(score))
+        self.index.set_score(picstats.path, score)
+
+    def pick_picstats(self, dirname: str) -> PicStats | None:
+        """
+        指定のディレクトリから評価スコアに応じた確率で PicStats を 1 つ抽出する
+
+        Args:
+            dirname (str): ディレクトリ名
+
+        Returns:
+            PicStats | None: 抽出した PicStats, ディレクトリが存在しない場合は None
+        """
+        with self.lock:
+            picdir = self.piclist.get(dirname)
+            if not picdir:
+                return None
+            name = picdir.sampler.sample()
+            return picdir[picdir.index_of(name)]
+
+    def next_picstats(self) -> PicStats | None:
+        """
+        PicStats リストにおいて, 注目中 PicStats の次のものを返す\n
+        末尾を注目中である場合はそれ自体を返す
+
+        Returns:
+            PicStats | None: 次の PicStats, 注目中のものがない場合は None
+        """
+        with self.lock:
+            picdir = self.piclist.get(self.crnt_dir)
+            if not picdir:
+                return None
+            return picdir[min(self.crnt_idx + 1, len(picdir) - 1)]
+
+    def prev_picstats(self) -> PicStats | None:
+        """
+        PicStats リストにおいて, 注目中 PicStats の前のものを返す\n
+        先頭を注目中である場合はそれ自体を返す
+
+        Returns:
+            PicStats | None: 前の PicStats, 注目中のものがない場合は None
+        """
+        with self.lock:
+            picdir = self.piclist.get(self.crnt_dir)
+            if not picdir:
+                return None
+            return picdir[max(self.crnt_idx - 1, 0)]
+
+    def dump_json(self, fp: TextIO, jsonl: bool = False) -> None:
+        """
+        このクラスを json としてストリームへ書き出す\n
+        ディレクトリ単位で逐次書き出すため, 全体を一度にメモリ上へ展開しない\n
+        各ディレクトリの PicStats 列はその時点のスナップショットを用いる
+
+        Args:
+            fp (TextIO): 書き出し先
+            jsonl (bool, optional): True の場合は 1 ディレクトリ 1 行の JSON Lines 形式.
+                Defaults to False.
+        """
+        with self.lock:
+            dirnames = list(self.piclist.keys())
+        if not jsonl:
+            fp.write("[")
+        is_first = True
+        for dirname in dirnames:
+            with self.lock:
+                picdir = self.piclist.get(dirname)
+                stats_list = list(picdir.stats) if picdir is not None else []
+            if not stats_list:
+                continue
+            entry = {"dir": dirname, "pics": [s.to_dict() for s in stats_list]}
+            if jsonl:
+                fp.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                continue
+            fp.write("\n" if is_first else ",\n")
+            fp.write(textwrap.indent(json.dumps(entry, ensure_ascii=False, indent=2), "  "))
+            is_first = False
+        if not jsonl:
+            fp.write("]" if is_first else "\n]")
+
+    def to_json(self) -> str:
+        """
+        このクラスを json に成形する
+
+        Returns:
+            str: json
+        """
+        buf = io.StringIO()
+        self.dump_json(buf)
+        return buf.getvalue()
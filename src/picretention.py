@@ -0,0 +1,153 @@
+"""
+生成画像の保持数, 容量の管理クラス
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, List
+
+from picmanager import PicManager, PicStats, upscaled_path
+
+
+@dataclass(frozen=True)
+class RetentionPolicy:
+    """
+    保持ポリシー\n
+    上限値が 0 の場合はその制限を行わない
+    """
+
+    # プロンプトディレクトリあたりの最大画像数
+    max_pics_per_dir: int = 300
+    # 画像ディレクトリ全体の最大容量 (byte)
+    max_total_bytes: int = 4 * 1024**3
+    # 容量超過時, 最大容量に対してこの割合まで削除する (削除の頻発を防ぐ)
+    total_bytes_low_water: float = 0.9
+
+
+def eviction_key(picstats: PicStats) -> tuple:
+    """
+    削除の優先順位を与えるキー\n
+    スコアが低いもの, 同スコアなら古いもの (ファイル名が生成日時から始まる) ほど優先される
+
+    Args:
+        picstats (PicStats): 対象の PicStats
+
+    Returns:
+        tuple: ソートキー
+    """
+    return (picstats.score, picstats.name)
+
+
+class PicRetention:
+    """
+    生成画像の保持数, 容量の管理クラス\n
+    上限を超過した場合は, スコアと生成日時に基づいて画像を削除し, PicManager へ差分を反映する\n
+    注目中 (表示中) の画像は削除しない
+    """
+
+    def __init__(self, picmanager: PicManager, policy: RetentionPolicy):
+        """
+        コンストラクタ
+
+        Args:
+            picmanager (PicManager): 管理対象の PicManager インスタンス
+            policy (RetentionPolicy): 保持ポリシー
+        """
+        self.picmanager = picmanager
+        self.policy = policy
+
+    def select_dir_victims(self, dirname: str) -> List[PicStats]:
+        """
+        指定のプロンプトディレクトリの画像数上限を超過した分の削除対象を選ぶ
+
+        Args:
+            dirname (str): ディレクトリ名
+
+        Returns:
+            List[PicStats]: 削除対象
+        """
+        limit = self.policy.max_pics_per_dir
+        if limit <= 0:
+            return []
+        with self.picmanager.lock:
+            crnt_picstats = self.picmanager.crnt_picstats
+            candidates = [
+                s for s in self.picmanager.get_picstats_list(dirname) if s is not crnt_picstats
+            ]
+            excess = len(self.picmanager.get_picstats_list(dirname)) - limit
+        if excess <= 0:
+            return []
+        return sorted(candidates, key=eviction_key)[:excess]
+
+    def select_total_victims(self, excluded: List[PicStats]) -> List[PicStats]:
+        """
+        画像ディレクトリ全体の容量上限を超過した分の削除対象を選ぶ
+
+        Args:
+            excluded (List[PicStats]): 削除対象に選定済みの PicStats
+
+        Returns:
+            List[PicStats]: 削除対象
+        """
+        limit = self.policy.max_total_bytes
+        if limit <= 0:
+            return []
+        total_bytes = self.picmanager.total_bytes - sum(s.size for s in excluded)
+        if total_bytes <= limit:
+            return []
+        target = limit * self.policy.total_bytes_low_water
+        excluded_ids = {id(s) for s in excluded}
+        with self.picmanager.lock:
+            crnt_picstats = self.picmanager.crnt_picstats
+            candidates = [
+                s
+                for picdir in self.picmanager.piclist.values()
+                for s in picdir.stats
+                if s is not crnt_picstats and id(s) not in excluded_ids
+            ]
+        victims: List[PicStats] = []
+        for picstats in sorted(candidates, key=eviction_key):
+            if total_bytes <= target:
+                break
+            victims.append(picstats)
+            total_bytes -= picstats.size
+        return victims
+
+    def enforce(self, dirnames: Iterable[str]) -> List[Path]:
+        """
+        保持ポリシーを適用する\n
+        指定のプロンプトディレクトリの画像数上限と, 全体の容量上限を検査し, 超過分を削除する\n
+        削除した画像にアップスケール画像があれば, それも削除する
+
+        Args:
+            dirnames (Iterable[str]): 画像が追加されたディレクトリ名群
+
+        Returns:
+            List[Path]: 削除した画像のパス群
+        """
+        victims: List[PicStats] = []
+        for dirname in set(dirnames):
+            victims.extend(self.select_dir_victims(dirname))
+        victims.extend(self.select_total_victims(victims))
+        if not victims:
+            return []
+
+        removed: List[Path] = []
+        for picstats in victims:
+            try:
+                picstats.path.unlink()
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"Error PicRetention {picstats.path}: {e}")
+                continue
+            removed.append(picstats.path)
+            try:
+                upscaled_path(picstats.path).unlink(missing_ok=True)
+            except OSError as e:
+                print(f"Error PicRetention {upscaled_path(picstats.path)}: {e}")
+        self.picmanager.remove_pics(removed)
+        print(f"Evicted {len(removed)} pics (total {self.picmanager.total_bytes} bytes)")
+        return removed
@@ -0,0 +1,179 @@
+"""
+重み付き無作為抽出クラス
+"""
+
+from __future__ import annotations
+
+import random
+from dataclasses import dataclass
+from typing import Dict, Generic, List, TypeVar
+
+K = TypeVar("K")
+
+
+@dataclass(frozen=True)
+class SamplerConsts:
+    """
+    このモジュール関連の定数
+    """
+
+    # スコア 1 あたりの重みの倍率
+    score_weight_base: float = 2.0
+    # 重みに反映するスコアの上下限
+    score_clamp: int = 4
+
+
+def score_to_weight(score: int) -> float:
+    """
+    評価スコアを抽出の重みに変換する\n
+    GOOD 1 回で表示確率が倍に, BAD 1 回で半分になる (上下限あり)
+
+    Args:
+        score (int): 評価スコア
+
+    Returns:
+        float: 重み
+    """
+    score = max(-SamplerConsts.score_clamp, min(score, SamplerConsts.score_clamp))
+    return SamplerConsts.score_weight_base**score
+
+
+class FenwickSampler(Generic[K]):
+    """
+    Fenwick 木による重み付き無作為抽出クラス\n
+    要素の追加, 削除, 重みの更新, 抽出をいずれも O(log n) で行う\n
+    削除した要素の位置は重み 0 として残し, 次の追加で再利用する
+    """
+
+    def __init__(self):
+        """
+        コンストラクタ
+        """
+        # tree[i] (1 始まり) は区間 (i - lowbit(i), i] の重みの和
+        self.tree: List[float] = [0.0]
+        self.weights: List[float] = []
+        self.keys: List[K | None] = []
+        self.slots: Dict[K, int] = {}
+        self.free_slots: List[int] = []
+
+    def __len__(self) -> int:
+        return len(self.slots)
+
+    @property
+    def total(self) -> float:
+        """
+        重みの総和
+
+        Returns:
+            float: 重みの総和
+        """
+        return self.prefix_sum(len(self.weights))
+
+    def prefix_sum(self, n: int) -> float:
+        """
+        先頭から n 個の位置の重みの和
+
+        Args:
+            n (int): 位置の個数
+
+        Returns:
+            float: 重みの和
+        """
+        total = 0.0
+        while n > 0:
+            total += self.tree[n]
+            n -= n & -n
+        return total
+
+    def add_delta(self, slot: int, delta: float) -> None:
+        """
+        指定の位置の重みに差分を加える
+
+        Args:
+            slot (int): 位置 (0 始まり)
+            delta (float): 差分
+        """
+        self.weights[slot] += delta
+        i = slot + 1
+        while i < len(self.tree):
+            self.tree[i] += delta
+            i += i & -i
+
+    def set(self, key: K, weight: float) -> None:
+        """
+        要素を追加する, すでに存在する場合は重みを更新する
+
+        Args:
+            key (K): 要素
+            weight (float): 重み (非負)
+        """
+        slot = self.slots.get(key)
+        if slot is None:
+            slot = self.allocate(key)
+        self.add_delta(slot, weight - self.weights[slot])
+
+    def allocate(self, key: K) -> int:
+        """
+        要素に重み 0 の位置を割り当てる
+
+        Args:
+            key (K): 要素
+
+        Returns:
+            int: 位置 (0 始まり)
+        """
+        if self.free_slots:
+            slot = self.free_slots.pop()
+        else:
+            slot = len(self.weights)
+            i = slot + 1
+            # 末尾への追加: tree[i] は区間 (i - lowbit(i), i - 1] の和 (+ 新しい重み 0)
+            self.tree.append(self.prefix_sum(i - 1) - self.prefix_sum(i - (i & -i)))
+            self.weights.append(0.0)
+            self.keys.append(None)
+        self.keys[slot] = key
+        self.slots[key] = slot
+        return slot
+
+    def remove(self, key: K) -> None:
+        """
+        要素を削除する, 存在しない場合は何もしない
+
+        Args:
+            key (K): 要素
+        """
+        slot = self.slots.pop(key, None)
+        if slot is None:
+            return
+        self.add_delta(slot, -self.weights[slot])
+        self.weights[slot] = 0.0
+        self.keys[slot] = None
+        self.free_slots.append(slot)
+
+    def sample(self, rng: random.Random | None = None) -> K | None:
+        """
+        重みに比例した確率で要素を 1 つ抽出する
+
+        Args:
+            rng (random.Random | None, optional): 乱数生成器, Defaults to None.
+
+        Returns:
+            K | None: 要素, 要素が存在しない場合は None
+        """
+        if not self.slots:
+            return None
+        target = (rng or random).random() * self.total
+        # 累積和が target を超える最小の位置を木の上から二分探索する
+        pos = 0
+        step = 1 << (len(self.tree) - 1).bit_length()
+        while step:
+            nxt = pos + step
+            if nxt < len(self.tree) and self.tree[nxt] <= target:
+                pos = nxt
+                target -= self.tree[nxt]
+            step >>= 1
+        slot = min(pos, len(self.keys) - 1)
+        if self.keys[slot] is None:
+            # 浮動小数の誤差で重み 0 の位置に落ちた場合は有効な要素を返す
+            return next(iter(self.slots))
+        return self.keys[slot]
@@ -0,0 +1,411 @@
+"""
+画像ディレクトリの監視クラス群\n
+アプリ外で追加, 削除, リネームされた画像を PicManager に差分として反映する
+"""
+
+from __future__ import annotations
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import threading
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Set
+
+from picmanager import PicManager, is_upscaled
+
+
+@dataclass(frozen=True)
+class PicWatcherConsts:
+    """
+    このクラス関連の定数
+    """
+
+    # ポーリング監視の周期 (s)
+    poll_interval: float = 5.0
+    # ディレクトリの最終更新時刻の分解能 (s, FAT の 2 秒に合わせる)
+    # (走査時刻からこの範囲内に更新されたディレクトリは, 取りこぼしを防ぐため次回も走査する)
+    mtime_granularity: float = 2.0
+    # inotify 監視の停止要求確認周期 (s)
+    inotify_timeout: float = 0.5
+    # inotify イベント読み出しバッファ長
+    inotify_bufsize: int = 64 * 1024
+
+    # inotify 定数 (linux/inotify.h)
+    in_close_write: int = 0x00000008
+    in_moved_from: int = 0x00000040
+    in_moved_to: int = 0x00000080
+    in_create: int = 0x00000100
+    in_delete: int = 0x00000200
+    in_q_overflow: int = 0x00004000
+    in_ignored: int = 0x00008000
+    in_isdir: int = 0x40000000
+    in_nonblock: int = 0x00000800
+    in_cloexec: int = 0x00080000
+
+
+def is_png(name: str) -> bool:
+    """
+    監視対象の画像ファイル名か (アップスケール画像は対象外)
+
+    Args:
+        name (str): ファイル名
+
+    Returns:
+        bool: True: 監視対象, False: 監視対象外
+    """
+    return name.lower().endswith(".png") and not is_upscaled(name)
+
+
+@dataclass
+class DirListing:
+    """
+    ポーリング監視で前回走査したディレクトリの内容
+    """
+
+    # 走査時のディレクトリの最終更新時刻 (ns)
+    mtime_ns: int
+    # 走査した時刻 (ns)
+    listed_at_ns: int
+    # 画像のファイル名群
+    names: Set[str] = field(default_factory=set)
+    # サブディレクトリのパス群
+    subdirs: Set[Path] = field(default_factory=set)
+
+    def is_stale(self, mtime_ns: int) -> bool:
+        """
+        再走査が必要か\n
+        最終更新時刻が変化した, あるいは走査時刻と分解能以内で変化を判別できない場合に必要とする
+
+        Args:
+            mtime_ns (int): 現在のディレクトリの最終更新時刻 (ns)
+
+        Returns:
+            bool: True: 再走査が必要, False: 前回から変化なし
+        """
+        granularity_ns = int(PicWatcherConsts.mtime_granularity * 1e9)
+        return mtime_ns != self.mtime_ns or mtime_ns + granularity_ns >= self.listed_at_ns
+
+
+class PicWatcher(ABC):
+    """
+    画像ディレクトリ監視の基底クラス\n
+    監視は専用のデーモンスレッドで行い, PicManager への反映は add_pics / remove_pics で行う
+    """
+
+    def __init__(self, picmanager: PicManager):
+        """
+        コンストラクタ
+
+        Args:
+            picmanager (PicManager): 反映先の PicManager インスタンス
+        """
+        self.picmanager = picmanager
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.run, args=(), daemon=True)
+
+    def start(self) -> None:
+        """
+        監視を開始する
+        """
+        self.thread.start()
+
+    def stop(self) -> None:
+        """
+        監視を停止し, 監視スレッドの終了を待つ
+        """
+        self.stop_event.set()
+        if self.thread.is_alive():
+            self.thread.join()
+
+    @abstractmethod
+    def run(self) -> None:
+        """
+        監視スレッドの処理
+        """
+        pass
+
+    def on_added(self, paths: List[Path]) -> None:
+        """
+        画像の追加を反映する\n
+        すでに piclist に存在する画像 (自身が保存したもの等) は無視する
+
+        Args:
+            paths (List[Path]): 追加された画像のパス群
+        """
+        paths = [path for path in paths if not self.picmanager.contains(path)]
+        if paths:
+            self.picmanager.add_pics(paths)
+
+    def on_removed(self, paths: List[Path]) -> None:
+        """
+        画像の削除を反映する
+
+        Args:
+            paths (List[Path]): 削除された画像のパス群
+        """
+        if paths:
+            self.picmanager.remove_pics(paths)
+
+    def on_dir_added(self, dirpath: Path) -> None:
+        """
+        ディレクトリの追加を反映する (ディレクトリ内の画像をすべて追加する)
+
+        Args:
+            dirpath (Path): 追加されたディレクトリのパス
+        """
+        paths: List[Path] = []
+        for subdirpath, _, filenames in os.walk(dirpath):
+            paths.extend(Path(subdirpath) / f for f in filenames if is_png(f))
+        self.on_added(paths)
+
+    def on_dir_removed(self, dirpath: Path) -> None:
+        """
+        ディレクトリの削除を反映する (ディレクトリ内の画像をすべて削除する)
+
+        Args:
+            dirpath (Path): 削除されたディレクトリのパス
+        """
+        self.on_removed([path for path in self.picmanager.paths() if dirpath in path.parents])
+
+
+class PollingPicWatcher(PicWatcher):
+    """
+    ポーリングによる監視クラス (全プラットフォーム向けのフォールバック)\n
+    周期的にディレクトリの最終更新時刻のみを確認し, 変化したディレクトリだけファイル名を走査して
+    前回の走査結果との差分を反映する (画像は Open しない)
+    """
+
+    def __init__(self, picmanager: PicManager, interval: float = PicWatcherConsts.poll_interval):
+        """
+        コンストラクタ
+
+        Args:
+            picmanager (PicManager): 反映先の PicManager インスタンス
+            interval (float, optional): 監視周期 (s), Defaults to PicWatcherConsts.poll_interval.
+        """
+        super().__init__(picmanager)
+        self.interval = interval
+        # ディレクトリのパス: 前回の走査結果
+        self.listings: Dict[Path, DirListing] = {}
+        # 初回走査前の piclist 上の画像のファイル名群 (ディレクトリのパスごと)
+        self.initial_names: Dict[Path, Set[str]] | None = None
+
+    def scan_dir(self, dirpath: Path, added: List[Path], removed: List[Path]) -> None:
+        """
+        ディレクトリを再帰的に確認し, 前回の走査結果からの差分を収集する\n
+        最終更新時刻が変化していないディレクトリはファイル名を走査せず, サブディレクトリのみ確認する
+
+        Args:
+            dirpath (Path): ディレクトリのパス
+            added (List[Path]): 追加された画像のパス群 (収集先)
+            removed (List[Path]): 削除された画像のパス群 (収集先)
+        """
+        listing = self.listings.get(dirpath)
+        try:
+            mtime_ns = os.stat(dirpath).st_mtime_ns
+            if listing is None or listing.is_stale(mtime_ns):
+                new_listing = DirListing(mtime_ns, time.time_ns())
+                with os.scandir(dirpath) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            new_listing.subdirs.add(Path(entry.path))
+                        elif is_png(entry.name):
+                            new_listing.names.add(entry.name)
+            else:
+                new_listing = listing
+        except OSError:
+            self.drop_dir(dirpath, removed)
+            return
+
+        if new_listing is not listing:
+            if listing is not None:
+                names = listing.names
+                for subdirpath in listing.subdirs - new_listing.subdirs:
+                    self.drop_dir(subdirpath, removed)
+            else:
+                names = (self.initial_names or {}).pop(dirpath, set())
+            added.extend(dirpath / name for name in new_listing.names - names)
+            removed.extend(dirpath / name for name in names - new_listing.names)
+            self.listings[dirpath] = new_listing
+
+        for subdirpath in new_listing.subdirs:
+            self.scan_dir(subdirpath, added, removed)
+
+    def drop_dir(self, dirpath: Path, removed: List[Path]) -> None:
+        """
+        存在しなくなったディレクトリの走査結果を破棄し, 配下の画像を削除されたものとして収集する
+
+        Args:
+            dirpath (Path): ディレクトリのパス
+            removed (List[Path]): 削除された画像のパス群 (収集先)
+        """
+        listing = self.listings.pop(dirpath, None)
+        if listing is None:
+            return
+        removed.extend(dirpath / name for name in listing.names)
+        for subdirpath in listing.subdirs:
+            self.drop_dir(subdirpath, removed)
+
+    def run(self) -> None:
+        while not self.stop_event.wait(self.interval):
+            try:
+                if self.initial_names is None:
+                    # 初回のみ piclist と比較する (以降は前回の走査結果と比較する)
+                    self.initial_names = {}
+                    for path in self.picmanager.paths():
+                        self.initial_names.setdefault(path.parent, set()).add(path.name)
+                added: List[Path] = []
+                removed: List[Path] = []
+                self.scan_dir(self.picmanager.rootdir, added, removed)
+                self.on_removed(sorted(removed))
+                self.on_added(sorted(added))
+            except Exception as e:
+                print(f"Error PollingPicWatcher: {e}")
+
+
+class InotifyPicWatcher(PicWatcher):
+    """
+    inotify による監視クラス (Linux 専用)\n
+    監視対象ディレクトリ以下の全ディレクトリを監視し, 作成, 削除, リネームのイベントを逐次反映する\n
+    ディレクトリの削除, リネームは親ディレクトリのイベントとして扱う
+    """
+
+    def __init__(self, picmanager: PicManager):
+        """
+        コンストラクタ
+
+        Args:
+            picmanager (PicManager): 反映先の PicManager インスタンス
+
+        Raises:
+            OSError: inotify が利用できない場合
+        """
+        super().__init__(picmanager)
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = self.libc.inotify_init1(
+            PicWatcherConsts.in_nonblock | PicWatcherConsts.in_cloexec
+        )
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        self.wds: Dict[int, Path] = {}
+        for dirpath, _, _ in os.walk(picmanager.rootdir):
+            self.add_watch(Path(dirpath))
+
+    def add_watch(self, dirpath: Path) -> None:
+        """
+        指定のディレクトリを監視対象に加える
+
+        Args:
+            dirpath (Path): ディレクトリのパス
+        """
+        mask = (
+            PicWatcherConsts.in_close_write
+            | PicWatcherConsts.in_moved_from
+            | PicWatcherConsts.in_moved_to
+            | PicWatcherConsts.in_create
+            | PicWatcherConsts.in_delete
+        )
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(dirpath), mask)
+        if wd < 0:
+            print(f"Error InotifyPicWatcher {dirpath}: {os.strerror(ctypes.get_errno())}")
+            return
+        self.wds[wd] = dirpath
+
+    def rm_watch(self, dirpath: Path) -> None:
+        """
+        指定のディレクトリとその配下を監視対象から外す\n
+        (監視対象ディレクトリ外へ移動されたディレクトリのイベントを受けないようにする)
+
+        Args:
+            dirpath (Path): ディレクトリのパス
+        """
+        for wd, path in list(self.wds.items()):
+            if path == dirpath or dirpath in path.parents:
+                self.libc.inotify_rm_watch(self.fd, wd)
+                del self.wds[wd]
+
+    def run(self) -> None:
+        try:
+            while not self.stop_event.is_set():
+                readable, _, _ = select.select([self.fd], [], [], PicWatcherConsts.inotify_timeout)
+                if not readable:
+                    continue
+                try:
+                    buf = os.read(self.fd, PicWatcherConsts.inotify_bufsize)
+                except BlockingIOError:
+                    continue
+                try:
+                    self.handle_events(buf)
+                except Exception as e:
+                    print(f"Error InotifyPicWatcher: {e}")
+        finally:
+            os.close(self.fd)
+
+    def handle_events(self, buf: bytes) -> None:
+        """
+        読み出したイベント群を順に反映する
+
+        Args:
+            buf (bytes): inotify_event 構造体の列
+        """
+        offset = 0
+        while offset < len(buf):
+            wd, mask, _, length = struct.unpack_from("iIII", buf, offset)
+            offset += struct.calcsize("iIII")
+            name = os.fsdecode(buf[offset : offset + length].rstrip(b"\0"))
+            offset += length
+
+            if mask & PicWatcherConsts.in_q_overflow:
+                # イベント取りこぼし時は全体を再構築する
+                self.picmanager.refresh_piclist()
+                continue
+            if mask & PicWatcherConsts.in_ignored:
+                self.wds.pop(wd, None)
+                continue
+            dirpath = self.wds.get(wd)
+            if dirpath is None:
+                continue
+
+            path = dirpath / name
+            if mask & PicWatcherConsts.in_isdir:
+                if mask & (PicWatcherConsts.in_create | PicWatcherConsts.in_moved_to):
+                    self.add_watch(path)
+                    # 監視開始前に書き込まれた画像を拾う
+                    self.on_dir_added(path)
+                elif mask & (PicWatcherConsts.in_delete | PicWatcherConsts.in_moved_from):
+                    self.rm_watch(path)
+                    self.on_dir_removed(path)
+                continue
+            if not is_png(name):
+                continue
+            if mask & (PicWatcherConsts.in_close_write | PicWatcherConsts.in_moved_to):
+                self.on_added([path])
+            elif mask & (PicWatcherConsts.in_delete | PicWatcherConsts.in_moved_from):
+                self.on_removed([path])
+
+
+def make_picwatcher(picmanager: PicManager) -> PicWatcher:
+    """
+    実行環境に応じた監視クラスを生成する\n
+    Linux では inotify を用い, それ以外または inotify が利用できない場合はポーリングで監視する
+
+    Args:
+        picmanager (PicManager): 反映先の PicManager インスタンス
+
+    Returns:
+        PicWatcher: 監視クラスインスタンス
+    """
+    if sys.platform.startswith("linux"):
+        try:
+            return InotifyPicWatcher(picmanager)
+        except (OSError, AttributeError) as e:
+            print(f"inotify is unavailable, fall back to polling: {e}")
+    return PollingPicWatcher(picmanager)
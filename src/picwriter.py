@@ -0,0 +1,186 @@
+"""
+生成画像の永続化 (展開, 書き込み, 索引の更新) を行う書き込みステージ
+"""
+
+from __future__ import annotations
+
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, List
+
+
+@dataclass(frozen=True)
+class WriterConsts:
+    """
+    このモジュール関連の定数
+    """
+
+    # 書き込み待ちキューの長さ
+    queue_size: int = 8
+    # 書き込みスレッド数
+    workers: int = 1
+    # キューが満杯の場合に投入側が待機する最大時間 (s), None で無制限, 0 で待機せず破棄
+    block_timeout: float | None = None
+
+
+class StageTimings:
+    """
+    処理ステージごとの所要時間の統計
+    """
+
+    def __init__(self):
+        """
+        コンストラクタ
+        """
+        self.lock = threading.Lock()
+        # ステージ名: [回数, 合計時間 (s), 最大時間 (s)]
+        self.stages: Dict[str, List[float]] = {}
+
+    def add(self, stage: str, elapsed: float) -> None:
+        """
+        所要時間を記録する
+
+        Args:
+            stage (str): ステージ名
+            elapsed (float): 所要時間 (s)
+        """
+        with self.lock:
+            record = self.stages.setdefault(stage, [0, 0.0, 0.0])
+            record[0] += 1
+            record[1] += elapsed
+            record[2] = max(record[2], elapsed)
+
+    @contextmanager
+    def measure(self, stage: str) -> Iterator[None]:
+        """
+        with ブロックの所要時間を記録する
+
+        Args:
+            stage (str): ステージ名
+
+        Yields:
+            Iterator[None]: なし
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - start)
+
+    def lines(self) -> List[str]:
+        """
+        ステージごとの統計を文字列で取得する
+
+        Returns:
+            List[str]: ステージごとの統計 (回数, 平均, 最大)
+        """
+        with self.lock:
+            stages = {stage: list(record) for stage, record in self.stages.items()}
+        return [
+            f"{stage}: count={int(count)}, avg={total / count * 1000:.1f} ms, "
+            f"max={max_elapsed * 1000:.1f} ms"
+            for stage, (count, total, max_elapsed) in stages.items()
+        ]
+
+
+class PicWriter:
+    """
+    生成画像の書き込みステージ\n
+    生成スレッドから投入された画像群を有界キュー経由で受け取り, 専用スレッドで保存する\n
+    キューが満杯の場合は WriterConsts.block_timeout に従って投入側を待たせる (背圧),
+    待機しきれない場合は投入を破棄する
+    """
+
+    def __init__(
+        self,
+        save: Callable[[Any, Any], None],
+        queue_size: int = WriterConsts.queue_size,
+        workers: int = WriterConsts.workers,
+        block_timeout: float | None = WriterConsts.block_timeout,
+    ):
+        """
+        コンストラクタ
+
+        Args:
+            save (Callable[[Any, Any], None]): 保存処理 (画像群データ, info 領域上のデータ)
+            queue_size (int, optional): 書き込み待ちキューの長さ,
+                Defaults to WriterConsts.queue_size.
+            workers (int, optional): 書き込みスレッド数, Defaults to WriterConsts.workers.
+            block_timeout (float | None, optional): 投入側が待機する最大時間 (s),
+                Defaults to WriterConsts.block_timeout.
+        """
+        self.save = save
+        self.block_timeout = block_timeout
+        self.jobs: queue.Queue[tuple | None] = queue.Queue(queue_size)
+        self.lock = threading.Lock()
+        self.num_written = 0
+        self.num_dropped = 0
+        self.num_blocked = 0
+        self.threads = [threading.Thread(target=self.run, daemon=True) for _ in range(workers)]
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, images: Any, infos: Any) -> bool:
+        """
+        画像群を書き込み待ちキューへ投入する
+
+        Args:
+            images (Any): 画像群データ
+            infos (Any): info 領域上のデータ
+
+        Returns:
+            bool: True: 投入した, False: キューが満杯のため破棄した
+        """
+        try:
+            self.jobs.put_nowait((images, infos))
+            return True
+        except queue.Full:
+            pass
+
+        with self.lock:
+            self.num_blocked += 1
+        try:
+            if self.block_timeout == 0:
+                raise queue.Full
+            self.jobs.put((images, infos), timeout=self.block_timeout)
+            return True
+        except queue.Full:
+            with self.lock:
+                self.num_dropped += 1
+            print(f"[WARN] PicWriter queue is full, dropped {len(images)} images.")
+            return False
+
+    def run(self) -> None:
+        """
+        書き込みスレッドの本体\n
+        終了指示 (None) を受け取るまで保存処理を繰り返す
+        """
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                return
+            try:
+                self.save(*job)
+                with self.lock:
+                    self.num_written += 1
+            except Exception as e:
+                print(f"Error PicWriter: {e}")
+
+    def close(self) -> None:
+        """
+        書き込み待ちの画像群をすべて保存し終えてから, 書き込みスレッドを停止する
+        """
+        for _ in self.threads:
+            self.jobs.put(None)
+        for thread in self.threads:
+            thread.join()
+
+    def __str__(self) -> str:
+        with self.lock:
+            return (
+                f"pending={self.jobs.qsize()}, written={self.num_written}, "
+                f"blocked={self.num_blocked}, dropped={self.num_dropped}"
+            )
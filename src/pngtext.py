@@ -0,0 +1,169 @@
+"""
+PNG のテキストチャンク (tEXt / zTXt / iTXt) を直接読み書きするモジュール
+"""
+
+from __future__ import annotations
+
+import struct
+import zlib
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Tuple
+
+
+@dataclass(frozen=True)
+class PngConsts:
+    """
+    このモジュール関連の定数
+    """
+
+    # PNG シグネチャ
+    signature: bytes = b"\x89PNG\r\n\x1a\n"
+    # 読み取るテキストチャンクの最大長 (PIL の MAX_TEXT_CHUNK に合わせる)
+    max_text_chunk: int = 1024 * 1024
+    # 展開後テキストの最大長
+    max_text_decompressed: int = 1024 * 1024
+
+
+def iter_chunks(fp: BinaryIO) -> Iterator[Tuple[bytes, int]]:
+    """
+    PNG のチャンクヘッダを先頭から順に走査する\n
+    各チャンクについてデータ部の先頭にファイル位置がある状態で (種別, 長さ) を返す\n
+    呼び出し側がデータ部を読まなかった場合も, 次のチャンクへは正しく移動する
+
+    Args:
+        fp (BinaryIO): シグネチャ直後に位置する PNG ファイル
+
+    Yields:
+        Iterator[Tuple[bytes, int]]: チャンク種別, データ長
+    """
+    while True:
+        header = fp.read(8)
+        if len(header) < 8:
+            return
+        length, cid = struct.unpack(">I4s", header)
+        start = fp.tell()
+        yield cid, length
+        # データ部と CRC を読み飛ばす
+        fp.seek(start + length + 4)
+
+
+def decode_text_chunk(cid: bytes, data: bytes) -> Tuple[str, str]:
+    """
+    テキストチャンクのデータ部をキーと値に分解する
+
+    Args:
+        cid (bytes): チャンク種別 (tEXt / zTXt / iTXt)
+        data (bytes): データ部
+
+    Returns:
+        Tuple[str, str]: キー, 値
+    """
+    key, _, rest = data.partition(b"\0")
+    key_str = key.decode("latin-1")
+    if cid == b"tEXt":
+        return key_str, rest.decode("latin-1", "replace")
+    if cid == b"zTXt":
+        text = zlib.decompressobj().decompress(rest[1:], PngConsts.max_text_decompressed)
+        return key_str, text.decode("latin-1", "replace")
+    # iTXt: 圧縮フラグ, 圧縮方式, 言語タグ\0, 翻訳キー\0, テキスト
+    compressed = rest[0:1] == b"\x01"
+    _, _, rest = rest[2:].partition(b"\0")
+    _, _, text = rest.partition(b"\0")
+    if compressed:
+        text = zlib.decompressobj().decompress(text, PngConsts.max_text_decompressed)
+    return key_str, text.decode("utf-8", "replace")
+
+
+def read_png_text(path: Path) -> Dict[str, str]:
+    """
+    PNG のテキストチャンクをキーと値の Dict として取得する\n
+    チャンクヘッダとテキストチャンクのデータ部のみを読み, 最初の IDAT チャンクで打ち切る\n
+    (PIL の Image.open が info 領域に格納する範囲と同じ)
+
+    Args:
+        path (Path): 画像のパス
+
+    Raises:
+        ValueError: PNG ではない場合
+
+    Returns:
+        Dict[str, str]: テキストチャンクの内容
+    """
+    texts: Dict[str, str] = {}
+    with open(path, "rb") as fp:
+        if fp.read(len(PngConsts.signature)) != PngConsts.signature:
+            raise ValueError("not a PNG file")
+        for cid, length in iter_chunks(fp):
+            if cid in (b"IDAT", b"IEND"):
+                break
+            if cid not in (b"tEXt", b"zTXt", b"iTXt") or length > PngConsts.max_text_chunk:
+                continue
+            key, value = decode_text_chunk(cid, fp.read(length))
+            texts[key] = value
+    return texts
+
+
+def make_chunk(cid: bytes, data: bytes) -> bytes:
+    """
+    チャンクのバイト列 (長さ, 種別, データ部, CRC) を生成する
+
+    Args:
+        cid (bytes): チャンク種別
+        data (bytes): データ部
+
+    Returns:
+        bytes: チャンクのバイト列
+    """
+    return struct.pack(">I", len(data)) + cid + data + struct.pack(">I", zlib.crc32(cid + data))
+
+
+def splice_png_text(png: bytes, chunks: Iterable[Tuple]) -> bytes:
+    """
+    PNG のバイト列に, 画素データを展開せずにチャンク群を挿入する\n
+    既存のテキストチャンクは取り除き, 指定のチャンク群を最初の IDAT チャンクの直前に挿入する\n
+    (PIL の PngInfo.chunks 形式, after_idat が指定されたチャンクは IEND の直前)\n
+    既存のチャンクはそのまま複写し, CRC は挿入するチャンクについてのみ計算する
+
+    Args:
+        png (bytes): PNG のバイト列
+        chunks (Iterable[Tuple]): (種別, データ部[, after_idat]) 群
+
+    Raises:
+        ValueError: PNG ではない, あるいはチャンク構造が壊れている場合
+
+    Returns:
+        bytes: チャンク群を挿入した PNG のバイト列
+    """
+    if not png.startswith(PngConsts.signature):
+        raise ValueError("not a PNG file")
+
+    before_idat: List[bytes] = []
+    after_idat: List[bytes] = []
+    for chunk in chunks:
+        (after_idat if len(chunk) > 2 and chunk[2] else before_idat).append(
+            make_chunk(chunk[0], chunk[1])
+        )
+
+    view = memoryview(png)
+    out: List[bytes | memoryview] = [PngConsts.signature]
+    pos = len(PngConsts.signature)
+    is_idat_found = False
+    while pos < len(png):
+        if pos + 8 > len(png):
+            raise ValueError("truncated PNG chunk header")
+        length, cid = struct.unpack_from(">I4s", png, pos)
+        end = pos + 12 + length
+        if end > len(png):
+            raise ValueError("truncated PNG chunk")
+        if cid == b"IDAT" and not is_idat_found:
+            is_idat_found = True
+            out.extend(before_idat)
+        elif cid == b"IEND":
+            if not is_idat_found:
+                raise ValueError("PNG without IDAT chunk")
+            out.extend(after_idat)
+        if cid not in (b"tEXt", b"zTXt", b"iTXt"):
+            out.append(view[pos:end])
+        pos = end
+    return b"".join(out)
@@ -0,0 +1,86 @@
+"""
+GPU の空き時間に画像を先行生成するキャラクタを選ぶスケジューラ
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Mapping, Tuple
+
+
+@dataclass(frozen=True)
+class PreGenConsts:
+    """
+    このモジュール関連の定数
+    """
+
+    # キャラクタあたりの先行生成の目標画像数
+    target_pics_per_chara: int = 8
+
+
+class PreGenScheduler:
+    """
+    先行生成の対象キャラクタを選ぶスケジューラ\n
+    画像数が目標に満たないキャラクタのうち, 画像が 1 枚もないもの, 最近表示されたもの,
+    画像数の少ないものの順に優先する
+    """
+
+    def __init__(self, target: int = PreGenConsts.target_pics_per_chara):
+        """
+        コンストラクタ
+
+        Args:
+            target (int, optional): キャラクタあたりの目標画像数,
+                Defaults to PreGenConsts.target_pics_per_chara.
+        """
+        self.target = target
+        self.lock = threading.Lock()
+        # キャラクタ名: 最後に表示対象となった時刻 (time.monotonic)
+        self.seen_at: Dict[str, float] = {}
+        self.num_reserved = 0
+
+    def mark_seen(self, name: str) -> None:
+        """
+        キャラクタが表示対象となったことを記録する
+
+        Args:
+            name (str): キャラクタ名
+        """
+        with self.lock:
+            self.seen_at[name] = time.monotonic()
+
+    def priority_key(self, name: str, count: int) -> Tuple[bool, float, int]:
+        """
+        先行生成の優先順位を与えるキー (小さいほど優先)
+
+        Args:
+            name (str): キャラクタ名
+            count (int): 既存の画像数
+
+        Returns:
+            Tuple[bool, float, int]: ソートキー
+        """
+        return (count > 0, -self.seen_at.get(name, float("-inf")), count)
+
+    def select(self, counts: Mapping[str, int]) -> str | None:
+        """
+        先行生成の対象キャラクタを選ぶ
+
+        Args:
+            counts (Mapping[str, int]): キャラクタ名: 既存の画像数
+
+        Returns:
+            str | None: キャラクタ名, すべて目標に達している場合は None
+        """
+        with self.lock:
+            candidates = [name for name, count in counts.items() if count < self.target]
+            if not candidates:
+                return None
+            self.num_reserved += 1
+            return min(candidates, key=lambda name: self.priority_key(name, counts[name]))
+
+    def __str__(self) -> str:
+        with self.lock:
+            return f"target={self.target}, seen={len(self.seen_at)}, reserved={self.num_reserved}"
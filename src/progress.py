@@ -0,0 +1,173 @@
+"""
+生成中の進捗 (/sdapi/v1/progress) を周期的に取得するポーラ
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Tuple
+
+
+@dataclass(frozen=True)
+class ProgressConsts:
+    """
+    このモジュール関連の定数
+    """
+
+    # 進捗の取得周期 (s)
+    poll_interval: float = 0.5
+
+
+@dataclass(frozen=True)
+class GenProgress:
+    """
+    1 サーバで処理中の生成の進捗
+    """
+
+    # 進捗率 (0.0 - 1.0)
+    progress: float
+    # 完了までの推定残り時間 (s)
+    eta: float
+    # 現在のサンプリングステップ
+    step: int
+    # サンプリングステップ数
+    steps: int
+    # 現在のジョブの識別子 (ジョブのタイムスタンプ, バッチ番号)
+    job: Tuple[str, int]
+
+    @classmethod
+    def from_json(cls, body: Dict[str, Any]) -> GenProgress:
+        """
+        /sdapi/v1/progress の応答から生成する
+
+        Args:
+            body (Dict[str, Any]): 応答の json
+
+        Returns:
+            GenProgress: 進捗
+        """
+        state = body.get("state") or {}
+        return cls(
+            float(body.get("progress") or 0.0),
+            float(body.get("eta_relative") or 0.0),
+            int(state.get("sampling_step") or 0),
+            int(state.get("sampling_steps") or 0),
+            (str(state.get("job_timestamp") or ""), int(state.get("job_no") or 0)),
+        )
+
+
+class ProgressPoller:
+    """
+    生成中の進捗のポーラ\n
+    専用スレッドで応答待ちの生成リクエストがあるサーバの進捗を周期的に取得し, 最新の進捗を保持する\n
+    同一ジョブ内でステップが進んだ間隔から, サーバごとのステップあたりの所要時間を記録する
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[[], Dict[str, Dict[str, Any]]],
+        interval: float = ProgressConsts.poll_interval,
+    ):
+        """
+        コンストラクタ
+
+        Args:
+            fetch (Callable[[], Dict[str, Dict[str, Any]]]): 進捗の取得処理 (サーバ: 応答の json)
+            interval (float, optional): 取得周期 (s), Defaults to ProgressConsts.poll_interval.
+        """
+        self.fetch = fetch
+        self.interval = interval
+        self.lock = threading.Lock()
+        # サーバ: 最新の進捗
+        self.latest: Dict[str, GenProgress] = {}
+        # サーバ: (最新の進捗, 取得時刻 (time.monotonic))
+        self.last_seen: Dict[str, Tuple[GenProgress, float]] = {}
+        # サーバ: [ステップ数, 合計時間 (s)]
+        self.step_timings: Dict[str, List[float]] = {}
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self) -> None:
+        """
+        ポーリングスレッドの本体\n
+        停止されるまで周期的に進捗を取得する
+        """
+        while not self.stop_event.wait(self.interval):
+            try:
+                bodies = self.fetch()
+            except Exception as e:
+                print(f"Error ProgressPoller: {e}")
+                continue
+            self.update(
+                {srv: GenProgress.from_json(body) for srv, body in bodies.items()},
+                time.monotonic(),
+            )
+
+    def update(self, progresses: Dict[str, GenProgress], now: float) -> None:
+        """
+        取得した進捗を反映し, ステップあたりの所要時間を記録する
+
+        Args:
+            progresses (Dict[str, GenProgress]): サーバ: 進捗
+            now (float): 取得時刻 (time.monotonic)
+        """
+        with self.lock:
+            self.latest = progresses
+            for srv, progress in progresses.items():
+                last = self.last_seen.get(srv)
+                self.last_seen[srv] = (progress, now)
+                if last is None:
+                    continue
+                last_progress, last_time = last
+                if last_progress.job != progress.job or progress.step <= last_progress.step:
+                    continue
+                record = self.step_timings.setdefault(srv, [0, 0.0])
+                record[0] += progress.step - last_progress.step
+                record[1] += now - last_time
+            for srv in set(self.last_seen) - set(progresses):
+                # 生成が終わったサーバは次回のジョブと区別するため忘れる
+                del self.last_seen[srv]
+
+    def overall(self) -> GenProgress | None:
+        """
+        全サーバを通じた進捗を取得する\n
+        進捗率は平均, 残り時間は最大をとる
+
+        Returns:
+            GenProgress | None: 進捗, 処理中の生成が存在しない場合は None
+        """
+        with self.lock:
+            progresses = list(self.latest.values())
+        if not progresses:
+            return None
+        return GenProgress(
+            sum(p.progress for p in progresses) / len(progresses),
+            max(p.eta for p in progresses),
+            sum(p.step for p in progresses),
+            sum(p.steps for p in progresses),
+            ("", 0),
+        )
+
+    def close(self) -> None:
+        """
+        ポーリングスレッドを停止する
+        """
+        self.stop_event.set()
+        self.thread.join()
+
+    def lines(self) -> List[str]:
+        """
+        サーバごとのステップあたりの所要時間を文字列で取得する
+
+        Returns:
+            List[str]: サーバごとの統計 (ステップ数, ステップあたりの平均時間)
+        """
+        with self.lock:
+            timings = {srv: list(record) for srv, record in self.step_timings.items()}
+        return [
+            f"{srv}: steps={int(steps)}, avg={total / steps:.3f} s/step"
+            for srv, (steps, total) in timings.items()
+        ]
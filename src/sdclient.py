@@ -0,0 +1,722 @@
+"""
+Stable Diffusion (A1111) API クライアント
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+@dataclass(frozen=True)
+class SDClientConsts:
+    """
+    このクラス関連の定数
+    """
+
+    # 接続プールに生成系リクエストとは別に確保する制御用の接続数
+    # (中断, 進捗取得, 死活確認が生成系リクエストの接続の空き待ちで塞がれないように)
+    control_connections: int = 3
+    # 生成系リクエストの同時送信数 (サーバ側のキューに積んでおく件数)
+    max_inflight: int = 2
+    # txt2img の反復 (n_iter) 1 回あたりの応答待ちのタイムアウト (s)
+    # (サーバ側で先行するリクエストの反復回数分も加算する)
+    txt2img_timeout: float = 60
+    # extra-single-image (アップスケール) のタイムアウト (s)
+    upscale_timeout: float = 120
+    # 死活確認, 進捗取得のタイムアウト (s)
+    ping_timeout: float = 2.0
+    # サーキットブレーカを開く (振り分け対象から除外する) までの連続失敗数
+    breaker_failure_threshold: int = 2
+    # サーキットブレーカを開いておく期間の初期値 (s), 再び開くたびに倍にする
+    breaker_open_duration: float = 30.0
+    # サーキットブレーカを開いておく期間の上限 (s)
+    breaker_max_open_duration: float = 300.0
+    # 死活確認の周期 (s)
+    health_check_interval: float = 10.0
+
+
+class NoBackendAvailableError(RuntimeError):
+    """
+    振り分け可能なサーバが存在しない (すべてのサーバのサーキットブレーカが開いている)
+    """
+
+
+@dataclass(frozen=True)
+class SDClientStats:
+    """
+    クライアントの接続統計
+    """
+
+    # 送信したリクエスト数 (死活確認, 進捗取得を含む)
+    requests: int
+    # 新規に確立した TCP 接続数
+    connections: int
+    # 応答待ちの生成系リクエスト数
+    inflight: int = 0
+    # 中断を要求した回数
+    interrupts: int = 0
+
+    @property
+    def reused(self) -> int:
+        """
+        既存の接続を再利用したリクエスト数
+
+        Returns:
+            int: 再利用数
+        """
+        return max(self.requests - self.connections, 0)
+
+    def __str__(self) -> str:
+        return (
+            f"requests={self.requests}, connections={self.connections}, reused={self.reused}, "
+            f"inflight={self.inflight}, interrupts={self.interrupts}"
+        )
+
+
+class SDClient:
+    """
+    Stable Diffusion (A1111) API クライアント\n
+    1 つのサーバに対して keep-alive な接続プールを保持し, リクエスト間で TCP 接続を使い回す\n
+    生成系リクエストは同時送信数 (ウィンドウ) の範囲で並行して送信できる
+    """
+
+    def __init__(
+        self,
+        ipaddr: str,
+        port: str,
+        pool_maxsize: int | None = None,
+        max_inflight: int = SDClientConsts.max_inflight,
+    ):
+        """
+        コンストラクタ
+
+        Args:
+            ipaddr (str): サーバの IP アドレス
+            port (str): サーバのポート
+            pool_maxsize (int | None, optional): 接続プールの最大接続数,
+                None の場合は同時送信数に制御用の接続数を加えた数, Defaults to None.
+            max_inflight (int, optional): 生成系リクエストの同時送信数,
+                Defaults to SDClientConsts.max_inflight.
+        """
+        self.ipaddr = ipaddr
+        self.port = port
+        self.base_url = f"http://{ipaddr}:{port}"
+        if pool_maxsize is None:
+            pool_maxsize = max_inflight + SDClientConsts.control_connections
+        self.session = requests.Session()
+        self.session.mount(
+            "http://", HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize, pool_block=True)
+        )
+        self.lock = threading.Lock()
+        self.num_requests = 0
+        self.window = threading.BoundedSemaphore(max_inflight)
+        # 応答待ちの生成リクエストの識別子: (タグ, 反復回数) (送信順, サーバは先頭から処理する)
+        # (タグが等価な別のリクエストと取り違えないよう, 送信ごとに生成した識別子をキーとする)
+        self.inflight: Dict[object, Tuple[Any, int]] = {}
+        # 応答待ちの先頭の生成リクエストの処理開始時刻 (time.perf_counter, 先行分の完了時刻)
+        self.head_started = 0.0
+        # 応答待ちの extra-single-image リクエスト数
+        self.num_inflight_extras = 0
+        # 先頭の生成リクエストの処理中に extra-single-image が送信されたか (所要時間が不正確)
+        self.is_head_shared = False
+        self.num_interrupts = 0
+
+    def close(self) -> None:
+        """
+        接続プールを閉じる
+        """
+        self.session.close()
+
+    def is_for(self, ipaddr: str, port: str) -> bool:
+        """
+        指定のサーバ向けのクライアントか
+
+        Args:
+            ipaddr (str): サーバの IP アドレス
+            port (str): サーバのポート
+
+        Returns:
+            bool: True: 指定のサーバ向け, False: 異なるサーバ向け
+        """
+        return self.ipaddr == ipaddr and self.port == port
+
+    def post(
+        self, path: str, payload: Dict[str, Any], timeout: float | Tuple[float, float]
+    ) -> Dict[str, Any]:
+        """
+        指定のエンドポイントへ json をポストし, 応答の json を返す
+
+        Args:
+            path (str): エンドポイントのパス
+            payload (Dict[str, Any]): ポストする json
+            timeout (float | Tuple[float, float]): タイムアウト (s), あるいは (接続, 応答待ち)
+
+        Raises:
+            requests.HTTPError: 応答がエラーステータスの場合
+
+        Returns:
+            Dict[str, Any]: 応答の json
+        """
+        with self.lock:
+            self.num_requests += 1
+        response = self.session.post(f"{self.base_url}{path}", json=payload, timeout=timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def get(self, path: str, params: Dict[str, str] | None = None) -> requests.Response:
+        """
+        指定のエンドポイントへ GET リクエストを送信する (死活確認, 進捗取得用)
+
+        Args:
+            path (str): エンドポイントのパス
+            params (Dict[str, str] | None, optional): クエリパラメータ, Defaults to None.
+
+        Returns:
+            requests.Response: 応答
+        """
+        with self.lock:
+            self.num_requests += 1
+        return self.session.get(
+            f"{self.base_url}{path}", params=params, timeout=SDClientConsts.ping_timeout
+        )
+
+    def ping(self) -> bool:
+        """
+        サーバの死活を確認する
+
+        Returns:
+            bool: True: 応答あり, False: 応答なし or エラーステータス
+        """
+        try:
+            return self.get("/internal/ping").ok
+        except requests.RequestException:
+            return False
+
+    def interrupt(self) -> bool:
+        """
+        サーバで処理中の生成を中断させる\n
+        中断された生成リクエストは途中までの結果で応答する
+
+        Returns:
+            bool: True: 中断を要求した, False: 要求に失敗した
+        """
+        try:
+            self.post("/sdapi/v1/interrupt", {}, SDClientConsts.ping_timeout)
+        except requests.RequestException as e:
+            print(f"Error SDClient interrupt {self.base_url}: {e}")
+            return False
+        with self.lock:
+            self.num_interrupts += 1
+        return True
+
+    def progress(self) -> Dict[str, Any] | None:
+        """
+        サーバで処理中の生成の進捗を取得する (途中経過の画像は取得しない)
+
+        Returns:
+            Dict[str, Any] | None: 応答の json, 取得に失敗した場合は None
+        """
+        try:
+            response = self.get("/sdapi/v1/progress", {"skip_current_image": "true"})
+            response.raise_for_status()
+            return response.json()
+        except (requests.RequestException, ValueError):
+            return None
+
+    def running_tag(self) -> Any:
+        """
+        サーバで処理中と推定される生成リクエストのタグ\n
+        サーバは受け付け順に処理するため, 応答待ちのうち最も古いものとみなす
+
+        Returns:
+            Any: タグ, 応答待ちの生成リクエストが存在しない場合は None
+        """
+        with self.lock:
+            return next((tag for tag, _ in self.inflight.values()), None)
+
+    def txt2img(
+        self,
+        payload: Dict[str, Any],
+        tag: Any = None,
+        on_server_elapsed: Callable[[float], None] | None = None,
+    ) -> Dict[str, Any]:
+        """
+        txt2img エンドポイントへポストする\n
+        同時送信数の上限に達している場合は空きが出るまで待機する\n
+        サーバは受け付け順に 1 件ずつ処理するため, 応答待ちのタイムアウトは
+        先行する応答待ちのリクエストと自身の反復回数の合計に比例させる\n
+        タイムアウトした場合, 自身がサーバで処理中と推定されれば中断を要求する
+        (放棄したリクエストの生成が続き, 再送と重複するのを防ぐ)\n
+        応答時には, サーバでの所要時間 (先行するリクエストの完了から応答まで) を通知する
+        (サーバは受け付け順に処理するため, 他のリクエストの処理待ちを含まない)
+
+        Args:
+            payload (Dict[str, Any]): ポストする json
+            tag (Any, optional): 応答待ちの間リクエストに付与するタグ (中断の判定用),
+                Defaults to None.
+            on_server_elapsed (Callable[[float], None] | None, optional):
+                サーバでの所要時間 (s) を受け取るコールバック, Defaults to None.
+
+        Returns:
+            Dict[str, Any]: 応答の json
+        """
+        request_id = object()
+        with self.window:
+            with self.lock:
+                if not self.inflight:
+                    self.start_head(time.perf_counter())
+                self.inflight[request_id] = (tag, max(1, int(payload.get("n_iter") or 1)))
+                num_iters = sum(n_iter for _, n_iter in self.inflight.values())
+            timeout = (SDClientConsts.ping_timeout, SDClientConsts.txt2img_timeout * num_iters)
+            is_succeeded = False
+            try:
+                body = self.post("/sdapi/v1/txt2img", payload, timeout)
+                is_succeeded = True
+                return body
+            except requests.Timeout:
+                with self.lock:
+                    is_running = next(iter(self.inflight), None) is request_id
+                if is_running:
+                    self.interrupt()
+                raise
+            finally:
+                now = time.perf_counter()
+                with self.lock:
+                    is_head = next(iter(self.inflight), None) is request_id
+                    started, is_shared = self.head_started, self.is_head_shared
+                    del self.inflight[request_id]
+                    if is_head:
+                        # 後続のリクエストの処理が始まる
+                        self.start_head(now)
+                if is_succeeded and is_head and not is_shared and on_server_elapsed is not None:
+                    on_server_elapsed(now - started)
+
+    def start_head(self, now: float) -> None:
+        """
+        応答待ちの先頭の生成リクエストの処理開始を記録する (ロック取得済みであること)
+
+        Args:
+            now (float): 処理開始時刻 (time.perf_counter)
+        """
+        self.head_started = now
+        self.is_head_shared = self.num_inflight_extras > 0
+
+    def extra_single_image(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        extra-single-image (単一画像の後処理, アップスケール) エンドポイントへポストする\n
+        生成系リクエストとして同時送信数の範囲で送信する
+
+        Args:
+            payload (Dict[str, Any]): ポストする json
+
+        Returns:
+            Dict[str, Any]: 応答の json
+        """
+        with self.window:
+            with self.lock:
+                self.num_inflight_extras += 1
+                self.is_head_shared = True
+            try:
+                return self.post(
+                    "/sdapi/v1/extra-single-image", payload, SDClientConsts.upscale_timeout
+                )
+            finally:
+                with self.lock:
+                    self.num_inflight_extras -= 1
+
+    def stats(self) -> SDClientStats:
+        """
+        接続統計を取得する
+
+        Returns:
+            SDClientStats: 接続統計
+        """
+        poolmanager = self.session.get_adapter(self.base_url).poolmanager
+        # プールの取得は新規プールの生成を伴いうるため, 既存のプールのみを集計する
+        connections = sum(
+            poolmanager.pools[key].num_connections for key in poolmanager.pools.keys()
+        )
+        with self.lock:
+            return SDClientStats(
+                self.num_requests, connections, len(self.inflight), self.num_interrupts
+            )
+
+
+class SDBackend:
+    """
+    バックエンドプール内の 1 サーバ\n
+    API クライアントと, 振り分けに用いる未完了リクエスト数, サーキットブレーカの状態を保持する\n
+    サーキットブレーカは連続失敗で開き (除外), 期間経過後に半開 (試行 1 件のみ振り分け) となり,
+    試行が成功すれば閉じる (復帰), 失敗すれば期間を倍にして再び開く
+    """
+
+    def __init__(self, client: SDClient):
+        """
+        コンストラクタ
+
+        Args:
+            client (SDClient): サーバの API クライアント
+        """
+        self.client = client
+        # 振り分け済みで未完了のリクエスト数 (ウィンドウの空き待ちを含む)
+        self.outstanding = 0
+        # 連続失敗数
+        self.failures = 0
+        # サーキットブレーカを連続で開いた回数
+        self.num_opens = 0
+        # この時刻 (time.monotonic) までサーキットブレーカを開いておく
+        self.open_until = 0.0
+
+    @property
+    def endpoint(self) -> Tuple[str, str]:
+        """
+        サーバの (IP アドレス, ポート)
+
+        Returns:
+            Tuple[str, str]: (IP アドレス, ポート)
+        """
+        return (self.client.ipaddr, self.client.port)
+
+    def state(self, now: float) -> str:
+        """
+        サーキットブレーカの状態
+
+        Args:
+            now (float): 現在時刻 (time.monotonic)
+
+        Returns:
+            str: "closed": 振り分け可能, "open": 除外中, "half-open": 試行 1 件のみ振り分け可能
+        """
+        if self.num_opens == 0:
+            return "closed"
+        return "open" if now < self.open_until else "half-open"
+
+    def is_available(self, now: float) -> bool:
+        """
+        振り分け対象とできるか
+
+        Args:
+            now (float): 現在時刻 (time.monotonic)
+
+        Returns:
+            bool: True: 振り分け可能, False: 除外中あるいは試行中
+        """
+        state = self.state(now)
+        return state == "closed" or (state == "half-open" and self.outstanding == 0)
+
+    def on_success(self) -> None:
+        """
+        リクエストの成功を記録し, サーキットブレーカを閉じる
+        """
+        self.failures = 0
+        self.num_opens = 0
+        self.open_until = 0.0
+
+    def on_failure(self, now: float) -> bool:
+        """
+        リクエストの失敗を記録し, 連続失敗数が閾値に達した (あるいは試行に失敗した) 場合は
+        サーキットブレーカを開く
+
+        Args:
+            now (float): 現在時刻 (time.monotonic)
+
+        Returns:
+            bool: True: サーキットブレーカを開いた, False: 閉じたまま
+        """
+        self.failures += 1
+        if self.num_opens == 0 and self.failures < SDClientConsts.breaker_failure_threshold:
+            return False
+        self.trip(now)
+        return True
+
+    def trip(self, now: float) -> None:
+        """
+        サーキットブレーカを開く
+
+        Args:
+            now (float): 現在時刻 (time.monotonic)
+        """
+        duration = SDClientConsts.breaker_open_duration * 2**self.num_opens
+        self.num_opens += 1
+        self.open_until = now + min(duration, SDClientConsts.breaker_max_open_duration)
+
+    def __str__(self) -> str:
+        return (
+            f"{self.client.base_url} [{self.state(time.monotonic())}] "
+            f"outstanding={self.outstanding}, failures={self.failures}, {self.client.stats()}"
+        )
+
+
+class SDBackendPool:
+    """
+    複数の Stable Diffusion サーバへ生成リクエストを振り分けるバックエンドプール\n
+    振り分け可能なサーバのうち, 未完了リクエスト数が最小のサーバへ振り分ける\n
+    失敗が続いたサーバはサーキットブレーカにより除外し, 死活確認で応答があれば試行を再開する
+    """
+
+    def __init__(self, max_inflight: int = SDClientConsts.max_inflight):
+        """
+        コンストラクタ
+
+        Args:
+            max_inflight (int, optional): サーバあたりの生成リクエストの同時送信数,
+                Defaults to SDClientConsts.max_inflight.
+        """
+        self.max_inflight = max_inflight
+        self.backends: Dict[Tuple[str, str], SDBackend] = {}
+        self.lock = threading.Lock()
+        # 振り分け可能なサーバが現れうる状態変化 (完了, 半開, 再設定) の通知
+        self.cond = threading.Condition(self.lock)
+        self.stop_event = threading.Event()
+        self.health_thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        """
+        死活確認スレッドを開始する
+        """
+        self.stop_event.clear()
+        self.health_thread = threading.Thread(target=self.run_health_check, daemon=True)
+        self.health_thread.start()
+
+    def close(self) -> None:
+        """
+        死活確認スレッドを停止し, すべてのサーバの接続プールを閉じる
+        """
+        self.stop_event.set()
+        if self.health_thread is not None:
+            self.health_thread.join()
+            self.health_thread = None
+        with self.lock:
+            backends = list(self.backends.values())
+            self.backends.clear()
+        for backend in backends:
+            backend.client.close()
+
+    def configure(self, endpoints: List[Tuple[str, str]]) -> None:
+        """
+        振り分け先のサーバ群を設定する\n
+        既存のサーバは状態を引き継ぎ, 外れたサーバは接続プールを閉じる
+
+        Args:
+            endpoints (List[Tuple[str, str]]): (IP アドレス, ポート) 群
+        """
+        with self.lock:
+            if list(self.backends.keys()) == endpoints:
+                return
+            backends = {}
+            for endpoint in endpoints:
+                backend = self.backends.pop(endpoint, None)
+                if backend is None:
+                    backend = SDBackend(SDClient(*endpoint, max_inflight=self.max_inflight))
+                backends[endpoint] = backend
+            removed = list(self.backends.values())
+            self.backends = backends
+            self.cond.notify_all()
+        for backend in removed:
+            print(f"SDBackend removed: {backend}")
+            backend.client.close()
+
+    def select(self) -> SDBackend | None:
+        """
+        振り分け先のサーバを選び, 未完了リクエスト数を加算する\n
+        呼び出し側は処理完了後に release() を呼ぶこと
+
+        Returns:
+            SDBackend | None: 振り分け先, 振り分け可能なサーバが存在しない場合は None
+        """
+        now = time.monotonic()
+        with self.lock:
+            candidates = [b for b in self.backends.values() if b.is_available(now)]
+            if not candidates:
+                return None
+            backend = min(candidates, key=lambda b: b.outstanding)
+            backend.outstanding += 1
+            return backend
+
+    def wait_available(self, timeout: float) -> bool:
+        """
+        振り分け可能なサーバが現れるまで待機する\n
+        サーキットブレーカが期間経過により半開となる時刻, あるいは状態変化の通知で再確認する
+
+        Args:
+            timeout (float): 最大待機時間 (s)
+
+        Returns:
+            bool: True: 振り分け可能なサーバが存在する, False: タイムアウトした
+        """
+        deadline = time.monotonic() + timeout
+        with self.cond:
+            while True:
+                now = time.monotonic()
+                backends = list(self.backends.values())
+                if any(b.is_available(now) for b in backends):
+                    return True
+                remaining = deadline - now
+                if remaining <= 0:
+                    return False
+                reopens = [b.open_until - now for b in backends if b.open_until > now]
+                self.cond.wait(min([remaining, *reopens]))
+
+    def release(self, backend: SDBackend, is_succeeded: bool) -> None:
+        """
+        振り分けたリクエストの完了を記録する\n
+        サーキットブレーカの状態を更新する
+
+        Args:
+            backend (SDBackend): 振り分け先
+            is_succeeded (bool): リクエストが成功したか
+        """
+        with self.lock:
+            backend.outstanding -= 1
+            self.cond.notify_all()
+            if is_succeeded:
+                backend.on_success()
+                return
+            is_tripped = backend.on_failure(time.monotonic())
+        if is_tripped:
+            print(f"SDBackend circuit opened: {backend}")
+
+    def dispatch(self, send: Callable[[SDClient], Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        振り分け先のサーバを選び, そのクライアントでリクエストを送信する
+
+        Args:
+            send (Callable[[SDClient], Dict[str, Any]]): 送信処理
+
+        Raises:
+            NoBackendAvailableError: 振り分け可能なサーバが存在しない場合
+            requests.RequestException: ポストに失敗した場合
+
+        Returns:
+            Dict[str, Any]: 応答の json
+        """
+        backend = self.select()
+        if backend is None:
+            raise NoBackendAvailableError("No SD backend available.")
+
+        is_succeeded = False
+        try:
+            body = send(backend.client)
+            is_succeeded = True
+            return body
+        finally:
+            self.release(backend, is_succeeded)
+
+    def txt2img(
+        self,
+        payload: Dict[str, Any],
+        tag: Any = None,
+        on_server_elapsed: Callable[[float], None] | None = None,
+    ) -> Dict[str, Any]:
+        """
+        振り分け先のサーバの txt2img エンドポイントへポストする
+
+        Args:
+            payload (Dict[str, Any]): ポストする json
+            tag (Any, optional): 応答待ちの間リクエストに付与するタグ (中断の判定用),
+                Defaults to None.
+            on_server_elapsed (Callable[[float], None] | None, optional):
+                サーバでの所要時間 (s) を受け取るコールバック, Defaults to None.
+
+        Raises:
+            NoBackendAvailableError: 振り分け可能なサーバが存在しない場合
+            requests.RequestException: ポストに失敗した場合
+
+        Returns:
+            Dict[str, Any]: 応答の json
+        """
+        return self.dispatch(lambda client: client.txt2img(payload, tag, on_server_elapsed))
+
+    def extra_single_image(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        振り分け先のサーバの extra-single-image エンドポイントへポストする
+
+        Args:
+            payload (Dict[str, Any]): ポストする json
+
+        Raises:
+            NoBackendAvailableError: 振り分け可能なサーバが存在しない場合
+            requests.RequestException: ポストに失敗した場合
+
+        Returns:
+            Dict[str, Any]: 応答の json
+        """
+        return self.dispatch(lambda client: client.extra_single_image(payload))
+
+    def interrupt(self, is_stale: Callable[[Any], bool]) -> int:
+        """
+        処理中の生成リクエストが不要になったサーバに中断を要求する
+
+        Args:
+            is_stale (Callable[[Any], bool]): タグから不要なリクエストかを判定する関数
+
+        Returns:
+            int: 中断を要求したサーバ数
+        """
+        with self.lock:
+            backends = list(self.backends.values())
+        num_interrupted = 0
+        for backend in backends:
+            tag = backend.client.running_tag()
+            if tag is not None and is_stale(tag) and backend.client.interrupt():
+                num_interrupted += 1
+        return num_interrupted
+
+    def progress(self) -> Dict[str, Dict[str, Any]]:
+        """
+        応答待ちの生成リクエストがあるサーバから, 処理中の生成の進捗を取得する
+
+        Returns:
+            Dict[str, Dict[str, Any]]: サーバの URL: 応答の json (取得に失敗したサーバは含まない)
+        """
+        with self.lock:
+            backends = list(self.backends.values())
+        progresses = {}
+        for backend in backends:
+            if backend.client.running_tag() is None:
+                continue
+            body = backend.client.progress()
+            if body is not None:
+                progresses[backend.client.base_url] = body
+        return progresses
+
+    def run_health_check(self) -> None:
+        """
+        死活確認スレッドの本体\n
+        周期的にすべてのサーバの死活を確認する\n
+        サーキットブレーカが開いているサーバに応答があれば半開として試行を再開させ,
+        閉じているサーバに応答がなければサーキットブレーカを開く
+        """
+        while not self.stop_event.wait(SDClientConsts.health_check_interval):
+            with self.lock:
+                backends = list(self.backends.values())
+            for backend in backends:
+                is_alive = backend.client.ping()
+                with self.lock:
+                    now = time.monotonic()
+                    state = backend.state(now)
+                    if is_alive and state == "open":
+                        backend.open_until = now
+                        self.cond.notify_all()
+                    elif not is_alive and state == "closed":
+                        backend.trip(now)
+                    else:
+                        continue
+                print(f"SDBackend {'half-opened' if is_alive else 'circuit opened'}: {backend}")
+
+    def stats(self) -> List[str]:
+        """
+        各サーバの状態と接続統計を取得する
+
+        Returns:
+            List[str]: サーバごとの状態
+        """
+        with self.lock:
+            backends = list(self.backends.values())
+        return [str(backend) for backend in backends]
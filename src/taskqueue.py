@@ -0,0 +1,197 @@
+"""
+スレッド間で共有するタスクキュー
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from typing import Callable, Dict, Generic, Hashable, List, TypeVar
+
+T = TypeVar("T")
+
+
+class TaskQueue(Generic[T]):
+    """
+    スレッドセーフな優先度付きタスクキュー\n
+    取り出し側はタスクが投入されるまでブロックし, 投入と同時に起床する\n
+    タスクはハッシュで索引付けされ, 等価なタスクの投入は既存のタスクへ統合される\n
+    注目グループ (set_focus) に属するタスクを優先し, それ以外は投入順 (FIFO) に取り出す\n
+    注目グループ外のタスクは有効期間を過ぎると取り出し時に破棄される\n
+    バックグラウンドのタスクは最低優先度とし, 通常のタスクが存在しない場合にのみ取り出す\n
+    close() 後は投入を受け付けず, 待機中の取り出し側は None を受け取って終了する
+    """
+
+    def __init__(
+        self,
+        coalesce: Callable[[T, T], None] | None = None,
+        group: Callable[[T], Hashable] | None = None,
+        ttl: float = 0,
+    ):
+        """
+        コンストラクタ
+
+        Args:
+            coalesce (Callable[[T, T], None] | None, optional):
+                等価なタスクの統合処理 (既存のタスク, 投入されたタスク), None の場合は破棄する,
+                Defaults to None.
+            group (Callable[[T], Hashable] | None, optional):
+                タスクの優先度を決めるグループのキー, None の場合はタスク自身,
+                Defaults to None.
+            ttl (float, optional): タスクの有効期間 (s), 0 の場合は無期限, Defaults to 0.
+        """
+        # 挿入順を保持する索引 (タスク自身をキーとする)
+        self.items: Dict[T, T] = {}
+        # グループごとの挿入順を保持する索引
+        self.groups: Dict[Hashable, Dict[T, T]] = {}
+        # タスクの有効期限 (time.monotonic)
+        self.expires: Dict[T, float] = {}
+        # バックグラウンドのタスクの挿入順を保持する索引 (有効期限なし)
+        self.background: Dict[T, T] = {}
+        self.coalesce = coalesce
+        self.group = group or (lambda item: item)
+        self.ttl = ttl
+        self.focus: Hashable | None = None
+        self.num_expired = 0
+        self.cond = threading.Condition()
+        self.is_closed = False
+
+    def __len__(self) -> int:
+        with self.cond:
+            return len(self.items) + len(self.background)
+
+    def __contains__(self, item: T) -> bool:
+        with self.cond:
+            return (item in self.items) or (item in self.background)
+
+    def put(self, item: T, background: bool = False) -> bool:
+        """
+        タスクを末尾に投入し, 待機中の取り出し側を 1 つ起床させる\n
+        等価なタスクが存在する場合は, 順序を変えずに既存のタスクへ統合し有効期限を延長する\n
+        等価なバックグラウンドのタスクが存在する場合は, それを通常のタスクへ格上げする\n
+        バックグラウンドのタスクは, 等価なタスクが存在する場合は投入しない
+
+        Args:
+            item (T): タスク
+            background (bool, optional): バックグラウンドのタスクか, Defaults to False.
+
+        Returns:
+            bool: True: 投入あるいは統合した, False: クローズ済みのため投入しなかった
+        """
+        with self.cond:
+            if self.is_closed:
+                return False
+            if background:
+                if (item not in self.items) and (item not in self.background):
+                    self.background[item] = item
+                    self.cond.notify()
+                return True
+            self.background.pop(item, None)
+            expire = time.monotonic() + self.ttl
+            existing = self.items.get(item)
+            if existing is not None:
+                if self.coalesce is not None:
+                    self.coalesce(existing, item)
+                self.expires[existing] = expire
+                return True
+            self.items[item] = item
+            self.groups.setdefault(self.group(item), {})[item] = item
+            self.expires[item] = expire
+            self.cond.notify()
+            return True
+
+    def set_focus(self, focus: Hashable | None) -> None:
+        """
+        優先して取り出すグループを設定する\n
+        キューの再構築は行わず, 次回の取り出しから反映される
+
+        Args:
+            focus (Hashable | None): グループのキー, None の場合は優先しない
+        """
+        with self.cond:
+            self.focus = focus
+
+    def pop_next(self) -> T | None:
+        """
+        次に実行すべきタスクを取り出す (ロック取得済みであること)\n
+        注目グループのタスクを優先し, 有効期限切れのタスクは破棄する\n
+        通常のタスクが存在しない場合はバックグラウンドのタスクを取り出す
+
+        Returns:
+            T | None: タスク, 有効なタスクが存在しない場合は None
+        """
+        now = time.monotonic()
+        while self.items:
+            focused = self.groups.get(self.focus)
+            item = next(iter(focused if focused else self.items))
+            expire = self.expires[item]
+            self.remove(item)
+            if focused or (self.ttl <= 0) or (now <= expire):
+                return item
+            self.num_expired += 1
+        if self.background:
+            item = next(iter(self.background))
+            del self.background[item]
+            return item
+        return None
+
+    def remove(self, item: T) -> None:
+        """
+        タスクを索引から削除する (ロック取得済みであること)
+
+        Args:
+            item (T): タスク
+        """
+        del self.items[item]
+        del self.expires[item]
+        key = self.group(item)
+        group = self.groups[key]
+        del group[item]
+        if not group:
+            del self.groups[key]
+
+    def get(self, timeout: float | None = None) -> T | None:
+        """
+        次に実行すべきタスクを取り出す, タスクが存在しない場合は投入されるまで待機する
+
+        Args:
+            timeout (float | None, optional): 最大待機時間 (s), None の場合は無制限,
+                Defaults to None.
+
+        Returns:
+            T | None: タスク, クローズ済みあるいはタイムアウトした場合は None
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.cond:
+            while not self.is_closed:
+                item = self.pop_next()
+                if item is not None:
+                    return item
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                self.cond.wait(remaining)
+            return None
+
+    def snapshot(self) -> List[T]:
+        """
+        キューの内容の複製を取得する
+
+        Returns:
+            List[T]: 投入順のタスク群 (バックグラウンドのタスクは末尾)
+        """
+        with self.cond:
+            return list(self.items) + list(self.background)
+
+    def close(self) -> None:
+        """
+        キューをクローズし, 待機中の取り出し側をすべて起床させる\n
+        未処理のタスクは破棄する
+        """
+        with self.cond:
+            self.is_closed = True
+            self.items.clear()
+            self.groups.clear()
+            self.expires.clear()
+            self.background.clear()
+            self.cond.notify_all()
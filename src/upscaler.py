@@ -0,0 +1,165 @@
+"""
+GOOD 評価された画像を GPU の空き時間にアップスケールする低優先度の後処理ステージ
+"""
+
+from __future__ import annotations
+
+import base64
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict
+
+from PIL import PngImagePlugin
+
+from picmanager import embed_pnginfo, upscaled_path
+from pngtext import read_png_text
+from taskqueue import TaskQueue
+
+
+@dataclass(frozen=True)
+class UpscaleConsts:
+    """
+    このモジュール関連の定数
+    """
+
+    # アップスケーラ名 (A1111 の upscaler_1)
+    upscaler: str = "R-ESRGAN 4x+"
+    # 拡大率
+    resize: float = 2.0
+    # 生成の空き待ち, 及び停止要求の確認周期 (s)
+    idle_poll_interval: float = 1.0
+    # アップスケール画像に付与する元画像のファイル名のキー
+    upscaled_from_key: str = "upscaled_from"
+
+
+class Upscaler:
+    """
+    アップスケールステージ\n
+    投入された画像を専用スレッドで extra-single-image へポストし,
+    結果を元画像と同じディレクトリに <stem>-upscaled.png として保存する\n
+    アップスケール画像には元画像のテキストチャンクと元画像のファイル名 (upscaled_from) を付与する\n
+    生成が空いている (is_idle が True) 間にのみ 1 件ずつ処理する
+    """
+
+    def __init__(
+        self,
+        post: Callable[[Dict[str, Any]], Dict[str, Any]],
+        is_idle: Callable[[], bool],
+        on_saved: Callable[[Path], None] | None = None,
+        upscaler: str = UpscaleConsts.upscaler,
+        resize: float = UpscaleConsts.resize,
+    ):
+        """
+        コンストラクタ
+
+        Args:
+            post (Callable[[Dict[str, Any]], Dict[str, Any]]): extra-single-image へのポスト処理
+            is_idle (Callable[[], bool]): 生成が空いているか
+            on_saved (Callable[[Path], None] | None, optional):
+                アップスケール画像の保存後に元画像のパスを受け取るコールバック, Defaults to None.
+            upscaler (str, optional): アップスケーラ名, Defaults to UpscaleConsts.upscaler.
+            resize (float, optional): 拡大率, Defaults to UpscaleConsts.resize.
+        """
+        self.post = post
+        self.is_idle = is_idle
+        self.on_saved = on_saved
+        self.upscaler = upscaler
+        self.resize = resize
+        self.jobs: TaskQueue[Path] = TaskQueue()
+        self.lock = threading.Lock()
+        self.num_upscaled = 0
+        self.num_skipped = 0
+        self.num_failed = 0
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def __len__(self) -> int:
+        return len(self.jobs)
+
+    def submit(self, path: Path) -> bool:
+        """
+        画像をアップスケール待ちキューへ投入する\n
+        アップスケール済み, あるいは投入済みの画像は重複して処理しない
+
+        Args:
+            path (Path): 元画像のパス
+
+        Returns:
+            bool: True: 投入した, False: アップスケール済みあるいは停止済み
+        """
+        if upscaled_path(path).exists():
+            return False
+        return self.jobs.put(path)
+
+    def run(self) -> None:
+        """
+        アップスケールスレッドの本体\n
+        停止されるまで, 生成が空いている間にキューの画像を 1 件ずつアップスケールする
+        """
+        while not self.stop_event.is_set():
+            if not self.is_idle():
+                self.stop_event.wait(UpscaleConsts.idle_poll_interval)
+                continue
+            path = self.jobs.get(UpscaleConsts.idle_poll_interval)
+            if path is None:
+                continue
+            try:
+                self.upscale(path)
+            except Exception as e:
+                with self.lock:
+                    self.num_failed += 1
+                print(f"Error Upscaler {path}: {e}")
+
+    def upscale(self, path: Path) -> None:
+        """
+        画像をアップスケールして保存する\n
+        元画像が存在しない, あるいはアップスケール済みの場合は何もしない\n
+        メタデータは PNG であればチャンク単位で付与し, 画素データの展開, 再圧縮は行わない
+
+        Args:
+            path (Path): 元画像のパス
+        """
+        dst = upscaled_path(path)
+        if dst.exists() or not path.exists():
+            with self.lock:
+                self.num_skipped += 1
+            return
+
+        body = self.post(
+            {
+                "resize_mode": 0,
+                "upscaling_resize": self.resize,
+                "upscaler_1": self.upscaler,
+                "image": base64.b64encode(path.read_bytes()).decode("ascii"),
+            }
+        )
+        image = base64.b64decode(body["image"].split(",", 1)[-1])
+
+        info = PngImagePlugin.PngInfo()
+        for key, value in read_png_text(path).items():
+            info.add_text(key, value)
+        info.add_text(UpscaleConsts.upscaled_from_key, path.name)
+        dst.write_bytes(embed_pnginfo(image, info))
+        with self.lock:
+            self.num_upscaled += 1
+        print(f"Upscaled: {dst}")
+        if self.on_saved is not None:
+            self.on_saved(path)
+
+    def close(self) -> None:
+        """
+        アップスケールスレッドを停止する\n
+        処理中の画像は完了を待ち, 未処理の画像は破棄する
+        """
+        self.stop_event.set()
+        self.jobs.close()
+        self.thread.join()
+
+    def __str__(self) -> str:
+        with self.lock:
+            return (
+                f"pending={len(self.jobs)}, upscaled={self.num_upscaled}, "
+                f"skipped={self.num_skipped}, failed={self.num_failed}"
+            )